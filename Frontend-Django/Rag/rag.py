@@ -1,41 +1,127 @@
 import os
 import sys
+import copy
+import asyncio
 import json
+import time
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 import importlib.util
 from pathlib import Path
 import nbformat
+import pandas as pd
 from nbconvert import PythonExporter
 
+RAG_DIR = os.path.join(os.path.dirname(__file__), '..', 'TableToVisualization-RAG', 'RAG')
+RAG_NOTEBOOK_PATH = os.path.join(RAG_DIR, 'RAG.ipynb')
+# Optional plain-python export of the notebook; imported directly when present
+RAG_MODULE_PATH = os.path.join(RAG_DIR, 'RAG.py')
+
+# Minimum number of seconds between two on-disk change checks
+RELOAD_CHECK_INTERVAL = 2.0
+
+# Size of the worker pool used by run_rag_pipeline
+RAG_MAX_WORKERS = 4
+
+# The feature classifier's answer is used as-is at or above this confidence;
+# below it the RAG model is consulted
+CASCADE_CONFIDENCE_THRESHOLD = 0.8
+
+# The feature classifier is shared with the RAG pipelines; loaded from their
+# directory like the notebook export, so there is a single implementation
+HEURISTICS_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'TableToVisualisation-RAG', 'RAG', 'chart_heuristics.py'
+)
+
+
+def _file_signature(path):
+    """(mtime, size) of a file, None if it is missing"""
+    try:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+
+def _load_heuristics(path=HEURISTICS_PATH):
+    try:
+        spec = importlib.util.spec_from_file_location('chart_heuristics', path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    except Exception as e:
+        print(f"Error loading chart heuristics: {e}")
+        return None
+
+
+chart_heuristics = _load_heuristics()
+HEURISTICS_SIGNATURE = _file_signature(HEURISTICS_PATH) if chart_heuristics is not None else None
+
+
+def feature_classify(data):
+    """
+    Cheap, vectorized guess at the chart type of extracted records
+
+    Runs chart_heuristics.classify_labels over the records' contexts.
+
+    Returns:
+        ('bar' | 'line', confidence between 0 and 1); confidence 0 when the
+        data is not a list of records or the heuristics are unavailable
+    """
+    if chart_heuristics is None or not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+        return 'line', 0.0
+
+    contexts = pd.Series([str(item.get('context', '')) for item in data], dtype=object)
+    return chart_heuristics.classify_labels(contexts)
+
+
 class RAGClassifier:
     """Wrapper for RAG notebook to classify visualization type"""
-    
-    def __init__(self):
+
+    def __init__(self, rag_path=RAG_NOTEBOOK_PATH, module_path=RAG_MODULE_PATH):
         self.rag_module = None
-        self.rag_path = os.path.join(os.path.dirname(__file__), '..', 'TableToVisualization-RAG', 'RAG', 'RAG.ipynb')
-        
-        if os.path.exists(self.rag_path):
+        self.rag_path = rag_path
+        self.module_path = module_path
+
+        if os.path.exists(self.module_path):
+            try:
+                # Import the exported module instead of converting the notebook
+                spec = importlib.util.spec_from_file_location('rag_module', self.module_path)
+                self.rag_module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(self.rag_module)
+            except Exception as e:
+                self.rag_module = None
+                print(f"Error loading RAG module: {e}")
+        elif os.path.exists(self.rag_path):
             try:
                 # Convert notebook to python
                 with open(self.rag_path) as f:
                     nb = nbformat.read(f, as_version=4)
-                
+
                 exporter = PythonExporter()
                 source, _ = exporter.from_notebook_node(nb)
-                
+
                 # Create a module from the source
                 import types
                 self.rag_module = types.ModuleType('rag_module')
                 exec(source, self.rag_module.__dict__)
             except Exception as e:
+                self.rag_module = None
                 print(f"Error loading RAG notebook: {e}")
-    
+
+    @property
+    def has_model(self):
+        """Whether the notebook provides a real predict_visualization_type"""
+        return self.rag_module is not None and hasattr(self.rag_module, 'predict_visualization_type')
+
     def classify_visualization(self, data_json):
         """
         Determine if the data should be visualized as a bar or line chart
-        
+
         Args:
             data_json: The JSON data to classify
-            
+
         Returns:
             'bar' or 'line'
         """
@@ -51,14 +137,14 @@ class RAGClassifier:
                     # If data has sequential numeric contexts or time-related contexts, suggest line chart
                     contexts = [item.get('context', '').lower() for item in data_json]
                     values = [item.get('value', 0) for item in data_json]
-                    
+
                     # Check for time patterns
                     time_indicators = ['day', 'month', 'year', 'hour', 'week', 'jan', 'feb', 'mar', 'apr']
                     has_time_context = any(any(t in ctx for t in time_indicators) for ctx in contexts)
-                    
+
                     # Check for sequential numbers in context
                     numeric_pattern = all(item.strip().isdigit() for item in contexts if item.strip())
-                    
+
                     if has_time_context or numeric_pattern:
                         return 'line'
                     else:
@@ -68,7 +154,150 @@ class RAGClassifier:
             print(f"Error in visualization classification: {e}")
             return 'line'  # Default to line on error
 
+
+class RAGClassifierService:
+    """
+    Process-wide owner of a single RAGClassifier.
+
+    The notebook is converted and executed once, the first time the service is
+    used (normally from CoreConfig.ready), and again only when the notebook or
+    its exported module changes on disk.
+
+    Requests go through a cascade: feature_classify answers when it is
+    confident enough, and only the rest reach the notebook model (or its
+    keyword fallback). tier_stats() reports how often each tier answered.
+    """
+
+    def __init__(self, rag_path=RAG_NOTEBOOK_PATH, module_path=RAG_MODULE_PATH,
+                 confidence_threshold=CASCADE_CONFIDENCE_THRESHOLD):
+        self.rag_path = rag_path
+        self.module_path = module_path
+        self.confidence_threshold = confidence_threshold
+        self._classifier = None
+        self._signature = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self._tiers = Counter()
+        self._tiers_lock = threading.Lock()
+
+    def _source_signature(self):
+        """(mtime, size) of each watched file, None for missing files"""
+        return tuple(_file_signature(path) for path in (self.rag_path, self.module_path))
+
+    def signature(self):
+        """
+        Identifies what decides a classification: the watched notebook
+        files, the cascade threshold and the loaded feature heuristics.
+        Results stored under another signature may be stale.
+        """
+        return repr((self._source_signature(), self.confidence_threshold, HEURISTICS_SIGNATURE))
+
+    def _get_classifier(self):
+        classifier = self._classifier
+        now = time.monotonic()
+        if classifier is not None and now - self._last_check < RELOAD_CHECK_INTERVAL:
+            return classifier
+
+        with self._lock:
+            self._last_check = now
+            signature = self._source_signature()
+            if self._classifier is None or signature != self._signature:
+                if self._classifier is not None:
+                    print("RAG notebook changed on disk, reloading classifier")
+                self._classifier = RAGClassifier(self.rag_path, self.module_path)
+                self._signature = signature
+            return self._classifier
+
+    def warm(self):
+        """Load the classifier ahead of the first request"""
+        self._get_classifier()
+
+    def _count(self, tier):
+        with self._tiers_lock:
+            self._tiers[tier] += 1
+
+    def tier_stats(self):
+        """Number of classifications answered by each tier since start-up"""
+        with self._tiers_lock:
+            return dict(self._tiers)
+
+    def classify(self, data):
+        """Classify a single extracted dataset as 'bar' or 'line'"""
+        viz_type, confidence = feature_classify(data)
+        if confidence >= self.confidence_threshold:
+            self._count('features')
+            return viz_type
+
+        classifier = self._get_classifier()
+        self._count('model' if classifier.has_model else 'fallback')
+        return classifier.classify_visualization(data)
+
+    def classify_many(self, datasets):
+        """Classify several extracted datasets, preserving their order"""
+        return [self.classify(data) for data in datasets]
+
+
+_service = None
+_service_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=RAG_MAX_WORKERS, thread_name_prefix='rag')
+
+
+def get_classifier_service():
+    """Return the process-wide RAGClassifierService, creating it on first use"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = RAGClassifierService()
+    return _service
+
+
+def classifier_signature():
+    """Signature of the process-wide classifier, see RAGClassifierService.signature"""
+    return get_classifier_service().signature()
+
+
 def determine_visualization_type(data):
     """Interface function to use the RAG classifier"""
-    rag = RAGClassifier()
-    return rag.classify_visualization(data)
\ No newline at end of file
+    return get_classifier_service().classify(data)
+
+
+def run_rag_pipeline(data, timeout=None):
+    """
+    Classify extracted data in-process on the bounded RAG worker pool
+
+    Args:
+        data: The extracted data for a single request
+        timeout: Seconds to wait for a result, or None to wait indefinitely
+
+    Returns:
+        'bar' or 'line'
+
+    Raises:
+        concurrent.futures.TimeoutError: If no result arrives within timeout
+    """
+    # Each request gets its own copy so the worker never shares mutable state
+    future = _executor.submit(get_classifier_service().classify, copy.deepcopy(data))
+    try:
+        return future.result(timeout=timeout)
+    except Exception:
+        future.cancel()
+        raise
+
+
+async def classify_async(data, timeout=None):
+    """
+    Awaitable version of run_rag_pipeline for async views
+
+    The classification runs on the same bounded worker pool, so the event
+    loop keeps serving other requests while the model works. The pool is
+    process-wide, so at most RAG_MAX_WORKERS classifications run at once
+    across all event loops (under WSGI each request has its own); the rest
+    queue for a free worker.
+
+    Raises:
+        asyncio.TimeoutError: If no result arrives within timeout
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_executor, get_classifier_service().classify, copy.deepcopy(data))
+    return await asyncio.wait_for(future, timeout)
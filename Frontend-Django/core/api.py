@@ -1,20 +1,137 @@
-from django.http import JsonResponse
-from .models import Visualization
-from rest_framework.decorators import api_view
+import re
+import gzip
+import json
+import hashlib
 
-@api_view(['GET'])
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import require_safe
+
+from .models import ExtractedData
+from .packed import CONTENT_TYPE, pack_records
+from .results import LRUCache
+
+# gzipped bodies by strong ETag; a given ETag always names the same bytes
+gzip_cache = LRUCache(getattr(settings, 'API_GZIP_CACHE_SIZE', 64))
+
+# Bodies smaller than this are not worth compressing
+GZIP_MIN_SIZE = 200
+
+BYTE_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
+
+def wants_packed(request):
+    """
+    True if the client asked for the packed binary layout, either with
+    ?format=packed or through its Accept header.
+    """
+    if 'format' in request.GET:
+        return request.GET['format'] == 'packed'
+    accept = request.headers.get('Accept', '')
+    return CONTENT_TYPE in accept or 'application/octet-stream' in accept
+
+
+def etag_matches(header, etag):
+    """
+    Strong comparison of an If-None-Match / If-Range value against etag.
+    """
+    if header.strip() == '*':
+        return True
+    return etag in (tag.strip() for tag in header.split(','))
+
+
+def byte_range(header, size):
+    """
+    Inclusive (first, last) byte positions of a single "bytes=" range, None
+    when the header should be ignored, or False when it is unsatisfiable.
+
+    Multi-range requests are answered with the full body.
+    """
+    match = BYTE_RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        # suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first >= size or first > last:
+        return False
+    return first, last
+
+
+def conditional_response(request, body, content_type):
+    """
+    Serve body with a strong ETag, answering 304 for a matching
+    If-None-Match, 206 for a satisfiable Range and compressing with gzip
+    when the client accepts it and no range was asked for.
+    """
+    digest = hashlib.sha256(body).hexdigest()
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if range_header and if_range and not etag_matches(if_range, f'"{digest}"'):
+        range_header = None
+
+    use_gzip = (
+        not range_header
+        and len(body) >= GZIP_MIN_SIZE
+        and ACCEPTS_GZIP.search(request.headers.get('Accept-Encoding', ''))
+    )
+    etag = f'"{digest}-gzip"' if use_gzip else f'"{digest}"'
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and etag_matches(if_none_match, etag):
+        response = HttpResponse(status=304)
+    elif range_header and (bounds := byte_range(range_header, len(body))) is not None:
+        if bounds is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{len(body)}'
+        else:
+            first, last = bounds
+            response = HttpResponse(body[first:last + 1], content_type=content_type, status=206)
+            response['Content-Range'] = f'bytes {first}-{last}/{len(body)}'
+    elif use_gzip:
+        compressed = gzip_cache.get(etag)
+        if compressed is None:
+            compressed = gzip.compress(body, mtime=0)
+            gzip_cache.set(etag, compressed)
+        response = HttpResponse(compressed, content_type=content_type)
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(body, content_type=content_type)
+
+    response['ETag'] = etag
+    response['Accept-Ranges'] = 'bytes'
+    patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+    return response
+
+
+@require_safe
 def visualization_data(request, id):
     """API endpoint to provide visualization data to Unity"""
-    try:
-        visualization = Visualization.objects.get(id=id)
-        return JsonResponse({
-            "success": True,
-            "data": visualization.processed_data,
-            "type": visualization.visualization_type,
-            "id": visualization.id
-        })
-    except Visualization.DoesNotExist:
+    entry = ExtractedData.objects.filter(id=id).only('id', 'extracted_json', 'visualization_type').first()
+    if entry is None:
         return JsonResponse({
             "success": False,
             "error": "Visualization not found"
-        }, status=404)
\ No newline at end of file
+        }, status=404)
+
+    data = entry.extracted_json or []
+    if wants_packed(request):
+        body = pack_records(data, entry.visualization_type)
+        content_type = CONTENT_TYPE
+    else:
+        body = json.dumps({
+            "success": True,
+            "data": data,
+            "type": entry.visualization_type,
+            "id": entry.id
+        }, separators=(',', ':')).encode('utf-8')
+        content_type = 'application/json'
+    return conditional_response(request, body, content_type)
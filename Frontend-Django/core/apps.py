@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Load the RAG classifier once per process instead of once per request
+        from Rag.rag import get_classifier_service
+        get_classifier_service().warm()
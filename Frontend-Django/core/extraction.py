@@ -0,0 +1,187 @@
+import re
+from bisect import bisect_left, bisect_right
+from itertools import chain
+
+# All patterns are compiled once at import time. The "key: $value" and
+# word/number strategies look at one line at a time; the separator and
+# "value units for key" strategies scan the whole text once, since their keys
+# and values may be split across lines. No pattern backtracks over more than
+# a run of digits, whitespace or key characters, so extraction stays linear
+# in the input size.
+
+# "key: $value" - the value part that follows the first usable colon
+KEY_VALUE_TAIL = re.compile(r'\s*\$?([0-9,.]+)')
+
+# "key: value", "key - value" or "key | value" - what follows the separator
+SEPARATOR_TAIL = re.compile(r'\s*(?:\$\s*)?([0-9,]+\.?\d*)')
+SEPARATORS = re.compile(r'[:|-]')
+CONTEXT_RUN = re.compile(r'[a-zA-Z0-9\s\-\.,&]+')
+
+# "value units for key" format (e.g. "10 items for category A"). A match can
+# only start where a run of digits starts: if it fails there, it fails at
+# every later digit of the run too, and retrying them would be quadratic.
+VALUE_FOR_KEY = re.compile(r'(?<!\d)(\d+(?:\.\d*)?)[\s]+([a-zA-Z]+)[\s]+(?:for|in|of)[\s]+([a-zA-Z0-9\s\-\.,&]+)')
+
+# Last resort: a word followed, anywhere later on the line, by a number
+WORD = re.compile(r'[A-Za-z]+')
+NUMBER = re.compile(r'\d[\d,.]*')
+
+
+def iter_lines(text):
+    """
+    Yield the lines of text one by one without building a list of them.
+    """
+    start = 0
+    while True:
+        end = text.find('\n', start)
+        if end == -1:
+            yield text[start:]
+            return
+        yield text[start:end]
+        start = end + 1
+
+
+def make_record(context, value_str):
+    """
+    Build a {"context", "value"} record, or None if the value is not a number.
+    """
+    try:
+        return {"context": context.strip(), "value": float(value_str.replace(',', ''))}
+    except ValueError:
+        return None
+
+
+def key_value_pair(line):
+    """
+    Leftmost "key: $value" pair on a line, as (key, value) strings.
+
+    The key is the text between two colons, so only the colons are visited.
+    """
+    segment_start = 0
+    colon = line.find(':')
+    while colon != -1:
+        if colon > segment_start:
+            match = KEY_VALUE_TAIL.match(line, colon + 1)
+            if match:
+                return line[segment_start:colon], match.group(1)
+        segment_start = colon + 1
+        colon = line.find(':', segment_start)
+    return None
+
+
+def separated_pairs(text):
+    """
+    All "key: value" / "key - value" / "key | value" pairs in text. Keys,
+    separators and values may be split across lines.
+
+    A key may itself contain '-', so for each key start the shortest key that
+    is followed by a separator and a number is taken. Every separator is
+    checked once, and the candidate key ends are looked up with bisect.
+    """
+    # candidate key ends: each valid separator plus the whitespace before it
+    starts, ends, numbers = [], [], []
+    for sep in SEPARATORS.finditer(text):
+        s = sep.start()
+        match = SEPARATOR_TAIL.match(text, s + 1)
+        if not match:
+            continue
+        w = s
+        while w > 0 and text[w - 1].isspace():
+            w -= 1
+        starts.append(w)
+        ends.append(s)
+        numbers.append(match)
+    if not numbers:
+        return
+
+    runs = [(m.start(), m.end()) for m in CONTEXT_RUN.finditer(text)]
+    run_starts = [start for start, _ in runs]
+
+    pos = 0
+    while pos < len(text):
+        r = bisect_right(run_starts, pos) - 1
+        if r < 0 or pos >= runs[r][1]:
+            # not inside a key run: skip to the next one
+            if r + 1 >= len(runs):
+                return
+            pos = runs[r + 1][0]
+            continue
+        run_end = runs[r][1]
+
+        i = bisect_left(ends, pos + 1)
+        key_end = max(starts[i], pos + 1) if i < len(ends) else None
+        if key_end is None or key_end > run_end:
+            # no separator is reachable from anywhere in this run
+            pos = run_end
+            continue
+
+        number = numbers[i]
+        yield text[pos:key_end], number.group(1)
+        pos = number.end()
+
+
+def value_for_key_pairs(text):
+    """
+    All "10 items for category A" pairs in text, as (key, value) strings.
+    """
+    for value, unit, key in VALUE_FOR_KEY.findall(text):
+        yield key, value
+
+
+def word_number_pairs(line):
+    """
+    Every word paired with the first number that follows it on the line.
+    """
+    pos = 0
+    while True:
+        word = WORD.search(line, pos)
+        if not word:
+            return
+        number = NUMBER.search(line, word.end())
+        if not number:
+            return
+        yield word.group(), number.group()
+        pos = number.end()
+
+
+def iter_records(text):
+    """
+    Stream {"context", "value"} records out of text.
+
+    Lines in "key: $value" form win and are yielded as the lines are read.
+    If none of the lines has that form, the separator and "value units for
+    key" matches over the whole text are returned instead, and failing
+    those the word/number fallback.
+    """
+    found = False
+    for line in iter_lines(text):
+        stripped = line.strip()
+        if not stripped:
+            continue
+        pair = key_value_pair(stripped)
+        if pair:
+            record = make_record(*pair)
+            if record:
+                found = True
+                yield record
+    if found:
+        return
+
+    pairs = chain(separated_pairs(text), value_for_key_pairs(text))
+    matches = list(filter(None, (make_record(*p) for p in pairs)))
+    if matches:
+        yield from matches
+        return
+
+    for line in iter_lines(text):
+        yield from filter(None, (make_record(*p) for p in word_number_pairs(line)))
+
+
+def unique_records(records):
+    """
+    Drop records whose context was already seen, keeping the first one.
+    """
+    unique = {}
+    for record in records:
+        unique.setdefault(record["context"], record)
+    return list(unique.values())
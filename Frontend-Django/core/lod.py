@@ -0,0 +1,93 @@
+import numpy as np
+
+
+def record_values(data):
+    """
+    Float array of the 'value' field of every record, or None if any record
+    is not a {"context", "value"} dict with a numeric value.
+    """
+    try:
+        return np.fromiter((float(item['value']) for item in data), dtype=np.float64, count=len(data))
+    except (TypeError, KeyError, ValueError):
+        return None
+
+
+def stride_indices(n, budget):
+    """
+    `budget` evenly spaced indices into n rows, first and last included.
+    """
+    return np.unique(np.linspace(0, n - 1, budget).round().astype(np.int64))
+
+
+def lttb_indices(values, budget):
+    """
+    Largest-Triangle-Three-Buckets decimation of a series with x = row index.
+
+    Keeps the first and last point and, from each of budget - 2 equal
+    buckets in between, the point forming the largest triangle with the
+    point kept before it and the mean of the next bucket. Peaks and dips
+    survive, unlike with plain striding.
+    """
+    n = len(values)
+    if budget >= n or budget < 3:
+        return np.arange(n) if budget >= n else stride_indices(n, budget)
+
+    x = np.arange(n, dtype=np.float64)
+    edges = np.linspace(1, n - 1, budget - 1).astype(np.int64)
+    kept = np.empty(budget, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+
+    a = 0
+    for i in range(budget - 2):
+        start, end = edges[i], edges[i + 1]
+        # the bucket after the last one is the final point alone
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = values[end:next_end].mean()
+
+        # twice the triangle areas; only the argmax matters
+        areas = np.abs(
+            (x[a] - avg_x) * (values[start:end] - values[a])
+            - (x[a] - x[start:end]) * (avg_y - values[a])
+        )
+        a = start + int(np.argmax(areas))
+        kept[i + 1] = a
+    return kept
+
+
+def top_n_with_other(data, values, budget):
+    """
+    The budget - 1 largest records in their original order, followed by one
+    "Other" record holding the sum of the rest.
+    """
+    keep = budget - 1
+    top = np.sort(np.argpartition(-values, keep - 1)[:keep]) if keep > 0 else np.array([], dtype=np.int64)
+    mask = np.ones(len(values), dtype=bool)
+    mask[top] = False
+    rest = int(mask.sum())
+    reduced = [data[i] for i in top]
+    reduced.append({
+        'context': f'Other ({rest} items)',
+        'value': float(values[mask].sum()),
+    })
+    return reduced
+
+
+def reduce_series(data, viz_type, budget):
+    """
+    At most `budget` records of `data` for a chart of `viz_type`.
+
+    Line charts are decimated with LTTB, bar charts keep the top values plus
+    an "Other" bucket. Data that is not a list of numeric records is only
+    strided. Returns (records, total row count).
+    """
+    total = len(data)
+    if total <= budget:
+        return data, total
+
+    values = record_values(data)
+    if values is None:
+        return [data[i] for i in stride_indices(total, budget)], total
+    if viz_type == 'bar':
+        return top_n_with_other(data, values, budget), total
+    return [data[i] for i in lttb_indices(values, budget)], total
@@ -0,0 +1,51 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.extraction import iter_records
+
+
+def synthetic_text(kind, n_lines, seed=0):
+    """
+    Build a synthetic report of n_lines lines.
+
+    'key_value' lines hit the first strategy, 'prose' lines the "value
+    units for key" pattern, and 'no_numbers' lines match nothing at all.
+    """
+    rng = random.Random(seed)
+    if kind == 'key_value':
+        lines = (f"Region {i} sales: ${rng.randint(1, 10**6):,}.{rng.randint(0, 99):02d}" for i in range(n_lines))
+    elif kind == 'prose':
+        lines = (f"The team shipped roughly {rng.randint(1, 5000)} units in week {i} despite delays"
+                 for i in range(n_lines))
+    else:
+        lines = ("lorem ipsum dolor sit amet consectetur adipiscing elit " * 4 for _ in range(n_lines))
+    return '\n'.join(lines)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark numerical data extraction over large synthetic inputs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=20000,
+                            help='Number of lines in the smallest input; each step doubles it')
+        parser.add_argument('--steps', type=int, default=4)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'input':<12}{'lines':>10}{'MB':>8}{'records':>10}{'best s':>10}{'MB/s':>10}")
+        for kind in ('key_value', 'prose', 'no_numbers'):
+            n_lines = options['lines']
+            for _ in range(options['steps']):
+                text = synthetic_text(kind, n_lines)
+                size_mb = len(text.encode('utf-8')) / 1e6
+                best = float('inf')
+                for _ in range(options['repeat']):
+                    t0 = time.perf_counter()
+                    count = sum(1 for _ in iter_records(text))
+                    best = min(best, time.perf_counter() - t0)
+                self.stdout.write(
+                    f"{kind:<12}{n_lines:>10}{size_mb:>8.1f}{count:>10}{best:>10.3f}{size_mb / best:>10.1f}"
+                )
+                n_lines *= 2
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_extracteddata_delete_visualization'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extracteddata',
+            name='text_hash',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -2,6 +2,9 @@ from django.db import models
 
 class ExtractedData(models.Model):
     raw_text = models.TextField()
+    # sha256 of the normalized input text and the classifier signature,
+    # used to serve repeated submissions
+    text_hash = models.CharField(max_length=64, unique=True, null=True, blank=True)
     extracted_json = models.JSONField()
     visualization_type = models.CharField(max_length=50)
     created_at = models.DateTimeField(auto_now_add=True)
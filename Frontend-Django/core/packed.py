@@ -0,0 +1,81 @@
+import struct
+
+import numpy as np
+
+# Packed layout of a visualization, all integers little-endian:
+#
+#   offset  size          field
+#   0       4             magic b'VRDT'
+#   4       2             format version (1)
+#   6       2             chart type length in bytes (t)
+#   8       4             row count (n)
+#   12      4             string table length in bytes (s)
+#   16      t, padded     chart type, UTF-8, zero-padded to a multiple of 4
+#   ...     4 * n         values, float32
+#   ...     4 * (n + 1)   label offsets into the string table, uint32
+#   ...     s             labels, UTF-8, concatenated
+#
+# Every array starts on a 4-byte boundary, so clients can view the values and
+# offsets in place (e.g. new Float32Array(buffer, offset, n)) without parsing,
+# and can fetch just the header and the values with a Range request.
+MAGIC = b'VRDT'
+VERSION = 1
+HEADER = struct.Struct('<4sHHII')
+CONTENT_TYPE = 'application/vnd.vr-data'
+
+
+def _padded(raw):
+    return raw + b'\0' * (-len(raw) % 4)
+
+
+def pack_records(records, chart_type):
+    """
+    Pack {"context", "value"} records and their chart type into bytes.
+
+    Values that are not numbers are stored as NaN.
+    """
+    values = np.empty(len(records), dtype='<f4')
+    labels = []
+    for i, record in enumerate(records):
+        try:
+            values[i] = float(record.get('value'))
+        except (TypeError, ValueError):
+            values[i] = np.nan
+        labels.append(str(record.get('context', '')).encode('utf-8'))
+
+    offsets = np.zeros(len(labels) + 1, dtype='<u4')
+    np.cumsum([len(label) for label in labels], out=offsets[1:])
+    strings = b''.join(labels)
+    chart = chart_type.encode('utf-8')
+
+    return b''.join([
+        HEADER.pack(MAGIC, VERSION, len(chart), len(records), len(strings)),
+        _padded(chart),
+        values.tobytes(),
+        offsets.tobytes(),
+        strings,
+    ])
+
+
+def unpack_records(payload):
+    """
+    Inverse of pack_records: (records, chart_type).
+    """
+    magic, version, chart_len, rows, strings_len = HEADER.unpack_from(payload)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('Not a packed visualization payload')
+
+    pos = HEADER.size
+    chart_type = payload[pos:pos + chart_len].decode('utf-8')
+    pos += chart_len + (-chart_len % 4)
+    values = np.frombuffer(payload, dtype='<f4', count=rows, offset=pos)
+    pos += 4 * rows
+    offsets = np.frombuffer(payload, dtype='<u4', count=rows + 1, offset=pos)
+    pos += 4 * (rows + 1)
+    strings = payload[pos:pos + strings_len]
+
+    records = [
+        {'context': strings[offsets[i]:offsets[i + 1]].decode('utf-8'), 'value': float(values[i])}
+        for i in range(rows)
+    ]
+    return records, chart_type
@@ -0,0 +1,140 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .extraction import iter_lines
+from .models import ExtractedData
+
+
+class LRUCache:
+    """
+    Small thread-safe least-recently-used mapping kept in process memory.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# In-memory tiers in front of the ExtractedData table, keyed by text hash
+# and by row id; both hold the same result dicts
+result_cache = LRUCache(getattr(settings, 'RESULT_CACHE_SIZE', 256))
+payload_cache = LRUCache(getattr(settings, 'RESULT_CACHE_SIZE', 256))
+
+
+def normalize_text(text):
+    """
+    Canonical form of an input: stripped, non-empty lines joined by '\\n'.
+
+    Extraction works on stripped lines and skips blank ones, so inputs that
+    only differ in line endings, indentation or blank lines extract the same.
+    """
+    return '\n'.join(line for line in (raw.strip() for raw in iter_lines(text)) if line)
+
+
+def text_hash(text, classifier_signature=None):
+    """
+    sha256 hex digest of the normalized text.
+
+    With a classifier signature the digest covers it too, so results cached
+    by an older classifier (reloaded model, changed heuristics) are not
+    served again.
+    """
+    key = normalize_text(text)
+    if classifier_signature is not None:
+        key = f'{key}\0{classifier_signature}'
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def _as_result(entry):
+    return {
+        'id': entry.id,
+        'data': entry.extracted_json,
+        'visualization_type': entry.visualization_type,
+    }
+
+
+def _remember(entry, digest=None):
+    result = _as_result(entry)
+    payload_cache.set(entry.id, result)
+    if digest is not None:
+        result_cache.set(digest, result)
+    return result
+
+
+async def aget_result(digest):
+    """
+    Cached {'id', 'data', 'visualization_type'} for a text hash, or None.
+    """
+    result = result_cache.get(digest)
+    if result is not None:
+        return result
+
+    entry = await ExtractedData.objects.filter(text_hash=digest).afirst()
+    if entry is None:
+        return None
+    return _remember(entry, digest)
+
+
+async def astore_result(digest, raw_text, data, viz_type):
+    """
+    Persist a processed submission and remember it in memory.
+    """
+    entry, _ = await ExtractedData.objects.aget_or_create(
+        text_hash=digest,
+        defaults={
+            'raw_text': raw_text,
+            'extracted_json': data,
+            'visualization_type': viz_type,
+        },
+    )
+    return _remember(entry, digest)
+
+
+async def astore_payload(raw_text, data, viz_type):
+    """
+    Persist a result that must not be served by text hash (e.g. a timed-out
+    classification), so it can still be referenced by id.
+    """
+    entry = await ExtractedData.objects.acreate(
+        raw_text=raw_text,
+        extracted_json=data,
+        visualization_type=viz_type,
+    )
+    return _remember(entry)
+
+
+async def aget_payload(entry_id):
+    """
+    {'id', 'data', 'visualization_type'} of an ExtractedData row, or None.
+    """
+    result = payload_cache.get(entry_id)
+    if result is not None:
+        return result
+
+    entry = await ExtractedData.objects.filter(id=entry_id).afirst()
+    if entry is None:
+        return None
+    return _remember(entry)
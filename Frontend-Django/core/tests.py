@@ -1,3 +1,281 @@
-from django.test import TestCase
+import re
+import gzip
+import json
+import random
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from .extraction import iter_records
+from .lod import lttb_indices, reduce_series
+from .models import ExtractedData
+from .packed import CONTENT_TYPE, unpack_records
+from .views import extract_numerical_data
+
+
+def legacy_extract_numerical_data(text):
+    """
+    The regex implementation extract_numerical_data replaced, kept as the
+    reference the single-pass extractor has to agree with.
+    """
+    data = []
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        match = re.search(r'([^:]+):\s*\$?([0-9,.]+)', line)
+        if match:
+            try:
+                data.append({"context": match.group(1).strip(), "value": float(match.group(2).strip().replace(',', ''))})
+                continue
+            except ValueError:
+                pass
+
+    if not data:
+        matches1 = re.findall(r'([a-zA-Z0-9\s\-\.,&]+?)[\s]*[:|-][\s]*\$?[\s]*([0-9,]+\.?\d*)', text)
+        matches2 = re.findall(r'(\d+\.?\d*)[\s]+([a-zA-Z]+)[\s]+(?:for|in|of)[\s]+([a-zA-Z0-9\s\-\.,&]+)', text)
+        for context, value in matches1 + [(key, value) for value, unit, key in matches2]:
+            try:
+                data.append({"context": context.strip(), "value": float(value.replace(',', ''))})
+            except ValueError:
+                continue
+
+    if not data:
+        for context, value in re.findall(r'([A-Za-z]+).*?(\d[\d,.]*)', text):
+            try:
+                data.append({"context": context.strip(), "value": float(value.replace(',', ''))})
+            except ValueError:
+                continue
+    return data
+
+
+
+def legacy_lttb(values, budget):
+    """Textbook Largest-Triangle-Three-Buckets over (index, value) points."""
+    n = len(values)
+    every = (n - 2) / (budget - 2)
+    kept = [0]
+    a = 0
+    for i in range(budget - 2):
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        avg_x = sum(range(avg_start, avg_end)) / (avg_end - avg_start)
+        avg_y = sum(values[avg_start:avg_end]) / (avg_end - avg_start)
+
+        best, best_area = None, -1.0
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((a - avg_x) * (values[j] - values[a]) - (a - j) * (avg_y - values[a]))
+            if area > best_area:
+                best, best_area = j, area
+        kept.append(best)
+        a = best
+    kept.append(n - 1)
+    return kept
+
+
+class ExtractionTests(SimpleTestCase):
+    LINES = [
+        "Revenue: $1,200.50",
+        "Q1: 10: 20",
+        "Cost:: 5",
+        "North region - 45",
+        "Apples | 3, Pears | 4.5, Plums - 7",
+        "Item A: abc, Item B - 12",
+        "Year 2020-2021 - 3,400",
+        "10 items for category A",
+        "12.5 kg of flour and 3 cups in bowl",
+        "The team shipped 35 units in week 3 despite delays",
+        "sold 100 units in January, 120 in February",
+        "version 1.2.3 released",
+        "no numbers here at all",
+        "$ 5",
+        "a-b-c-1-2",
+        "Total & tax, net - $ 99.",
+        ": 5",
+        "...",
+    ]
+
+    def test_lines_match_legacy(self):
+        for line in self.LINES:
+            with self.subTest(line=line):
+                self.assertEqual(extract_numerical_data(line), legacy_extract_numerical_data(line))
+
+    def test_random_lines_match_legacy(self):
+        rng = random.Random(0)
+        alphabet = 'ab Z09,.:|-$&\t' + 'for in of '
+        for _ in range(2000):
+            line = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+            with self.subTest(line=line):
+                self.assertEqual(list(iter_records(line)), legacy_extract_numerical_data(line))
+
+    def test_random_texts_match_legacy(self):
+        rng = random.Random(1)
+        alphabet = 'ab Z09,.:|-$&\t\n\n' + 'for in of 1.5 '
+        for _ in range(3000):
+            text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 60)))
+            with self.subTest(text=text):
+                self.assertEqual(list(iter_records(text)), legacy_extract_numerical_data(text))
+
+    def test_key_value_lines_win(self):
+        text = "Sales report\nNorth: 10\nSouth - 20\n\n  East: $1,000  \n30 units for West"
+        self.assertEqual(extract_numerical_data(text), legacy_extract_numerical_data(text))
+        self.assertEqual([r['context'] for r in extract_numerical_data(text)], ['North', 'East'])
+
+    def test_pairs_split_across_lines(self):
+        for text in [
+            "A:\n100",
+            "Total\n- 5",
+            "Report\nA - 10",
+            "Revenue\n  |\n  $ 1,000\nCost - 20",
+            "12\nunits\nfor\nNorth and South",
+            "North region\n\n:\n\n45",
+        ]:
+            with self.subTest(text=text):
+                self.assertEqual(extract_numerical_data(text), legacy_extract_numerical_data(text))
+        self.assertEqual(extract_numerical_data("A:\n100"), [{"context": "A", "value": 100.0}])
+        self.assertEqual(extract_numerical_data("Report\nA - 10"), [{"context": "Report\nA", "value": 10.0}])
+
+    def test_long_digit_run(self):
+        # took minutes while "value units for key" was retried at every digit
+        self.assertEqual(extract_numerical_data("9" * 100000 + " kg for flour"), [{"context": "flour", "value": float("inf")}])
+
+    def test_fallback_over_several_lines(self):
+        text = "alpha beta 12\nno digits\ngamma 3.5 delta 4"
+        self.assertEqual(extract_numerical_data(text), legacy_extract_numerical_data(text))
+
+
+class LevelOfDetailTests(SimpleTestCase):
+    def test_lttb_matches_reference(self):
+        rng = np.random.default_rng(0)
+        for n, budget in [(10, 3), (100, 7), (1000, 50), (1001, 999), (5000, 64)]:
+            values = rng.standard_normal(n).cumsum()
+            with self.subTest(n=n, budget=budget):
+                self.assertEqual(lttb_indices(values, budget).tolist(), legacy_lttb(values.tolist(), budget))
+
+    def test_lttb_keeps_spikes(self):
+        values = np.zeros(10000)
+        values[1234], values[8765] = 100.0, -100.0
+        kept = lttb_indices(values, 20)
+        self.assertEqual(len(kept), 20)
+        self.assertEqual((kept[0], kept[-1]), (0, 9999))
+        self.assertIn(1234, kept)
+        self.assertIn(8765, kept)
+
+    def test_small_series_pass_through(self):
+        data = [{'context': str(i), 'value': i} for i in range(5)]
+        self.assertEqual(reduce_series(data, 'line', 10), (data, 5))
+
+    def test_bar_keeps_top_values_and_other(self):
+        data = [{'context': str(i), 'value': v} for i, v in enumerate([5, 1, 9, 2, 7, 3])]
+        reduced, total = reduce_series(data, 'bar', 3)
+        self.assertEqual(total, 6)
+        self.assertEqual(reduced[:2], [data[2], data[4]])
+        self.assertEqual(reduced[2], {'context': 'Other (4 items)', 'value': 11.0})
+
+    def test_non_numeric_data_is_strided(self):
+        data = [{'context': str(i), 'value': 'n/a'} for i in range(100)]
+        reduced, total = reduce_series(data, 'line', 5)
+        self.assertEqual(total, 100)
+        self.assertEqual([r['context'] for r in reduced], ['0', '25', '50', '74', '99'])
+
+
+class VisualizeWindowTests(TestCase):
+    def setUp(self):
+        session = self.client.session
+        session['visualization_data'] = {'data': [{'context': str(i), 'value': i} for i in range(50)]}
+        session.save()
+
+    def window(self, **params):
+        response = self.client.get(reverse('line_chart'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['start'], response.context['end'], response.context['window_rows']
+
+    def test_window_is_clamped_to_the_data(self):
+        self.assertEqual(self.window(), (0, 50, 50))
+        self.assertEqual(self.window(start=10, end=20), (10, 20, 10))
+        self.assertEqual(self.window(start=-5, end=500), (0, 50, 50))
+        self.assertEqual(self.window(start=80, end=90), (50, 50, 0))
+        self.assertEqual(self.window(start=30, end=10), (30, 30, 0))
+        self.assertEqual(self.window(start='x', end='y'), (0, 50, 50))
+
+    def test_points_budget(self):
+        response = self.client.get(reverse('line_chart'), {'points': 10})
+        self.assertEqual(response.context['shown_rows'], 10)
+        self.assertEqual(response.context['total_rows'], 50)
+
+
+class VisualizationApiTests(TestCase):
+    def setUp(self):
+        self.records = [{'context': f'Label {i}', 'value': i * 1.5} for i in range(40)]
+        self.entry = ExtractedData.objects.create(raw_text='', extracted_json=self.records, visualization_type='line')
+        self.url = reverse('visualization_data', args=[self.entry.id])
+
+    def test_json_body_and_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertTrue(response['ETag'].startswith('"'))
+        body = json.loads(response.content)
+        self.assertEqual(body['data'], self.records)
+        self.assertEqual(body['type'], 'line')
+
+    def test_not_found(self):
+        self.assertEqual(self.client.get(reverse('visualization_data', args=[self.entry.id + 1])).status_code, 404)
+
+    def test_if_none_match(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_gzip(self):
+        plain = self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertNotEqual(response['ETag'], plain['ETag'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_ranges(self):
+        full = self.client.get(self.url).content
+        size = len(full)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, full[10:20])
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{size}')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(response.content, full[-5:])
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={size - 3}-')
+        self.assertEqual(response.content, full[-3:])
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-999999')
+        self.assertEqual(response.content, full)
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={size}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{size}')
+
+        # multi-range and malformed headers get the whole body
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=0-1,4-5').status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='items=0-1').status_code, 200)
+
+    def test_range_is_not_compressed(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 206)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_if_range(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag).status_code, 206)
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"').status_code, 200)
+
+    def test_packed(self):
+        for kwargs in ({'data': {'format': 'packed'}}, {'HTTP_ACCEPT': CONTENT_TYPE}):
+            response = self.client.get(self.url, **kwargs)
+            self.assertEqual(response['Content-Type'], CONTENT_TYPE)
+            records, chart_type = unpack_records(response.content)
+            self.assertEqual(chart_type, 'line')
+            self.assertEqual(records, self.records)
@@ -1,10 +1,11 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('process/', views.process_text, name='process_text'),
     path('bar/', views.visualize, {'viz_type': 'bar'}, name='bar_chart'),
     path('line/', views.visualize, {'viz_type': 'line'}, name='line_chart'),
+    path('api/visualization/<int:id>/', api.visualization_data, name='visualization_data'),
     path('<str:viz_type>/', views.visualize, name='visualize'),  # Generic visualize path
 ]
\ No newline at end of file
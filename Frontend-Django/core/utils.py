@@ -5,9 +5,11 @@ import re
 from io import StringIO
 import sys
 import os
-import subprocess
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from django.conf import settings
 
+from Rag.rag import run_rag_pipeline
+
 def extract_numerical_data(text_data):
     """
     Extract numerical data from text and convert it to JSON.
@@ -98,51 +100,22 @@ def determine_visualization_type_with_rag(data):
     Use RAG model to determine the appropriate visualization type.
     """
     try:
-        # Save the data to a temporary file
-        temp_file_path = os.path.join(settings.BASE_DIR, 'temp_data.json')
-        with open(temp_file_path, 'w') as f:
-            json.dump(data, f)
-        
-        # Path to the RAG.ipynb
-        rag_notebook_path = os.path.join(settings.BASE_DIR, 'RAG', 'RAG.ipynb')
-        
-        # Execute the notebook with the data
-        result = subprocess.run([
-            'jupyter', 'nbconvert', 
-            '--to', 'notebook', 
-            '--execute', 
-            '--output', 'rag_output.ipynb', 
-            '--ExecutePreprocessor.timeout=60',
-            '--ExecutePreprocessor.kernel_name=python3',
-            f'--param "data_path={temp_file_path}"',
-            rag_notebook_path
-        ], capture_output=True, text=True)
-        
-        # Read the output - this assumes the notebook saves its output to a file
-        output_file_path = os.path.join(settings.BASE_DIR, 'rag_output.txt')
-        if os.path.exists(output_file_path):
-            with open(output_file_path, 'r') as f:
-                viz_type = f.read().strip()
-                # Clean up
-                os.remove(output_file_path)
-            
-            # Clean up temp data file
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
-                
+        # Classify in-process on the shared worker pool; the data never
+        # touches disk, so concurrent requests cannot see each other's input
+        viz_type = run_rag_pipeline(data, timeout=getattr(settings, 'RAG_TIMEOUT', 60))
+        if viz_type:
             return viz_type
-        
-        # Clean up temp data file
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
-            
+
         # Default to bar chart if RAG fails
-        return 'bar_chart'
-        
+        return 'bar'
+
+    except FuturesTimeoutError:
+        print("RAG visualization determination timed out")
+        return 'bar'
     except Exception as e:
         print(f"Error in RAG visualization determination: {e}")
         # Default to bar chart if there's an error
-        return 'bar_chart'
+        return 'bar'
 
 def process_text_data(text_data):
     """
@@ -2,8 +2,11 @@ import re
 import os
 import sys
 import json
+import asyncio
 import numpy as np
 import pandas as pd
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
@@ -12,7 +15,12 @@ from django.views.decorators.csrf import csrf_exempt
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Import your RAG model
-from Rag.rag import determine_visualization_type
+from Rag.rag import classifier_signature, classify_async
+from .extraction import iter_lines, iter_records, unique_records
+from .lod import reduce_series
+from .results import aget_payload, aget_result, astore_payload, astore_result, text_hash
+
+NUMBER_IN_VALUE = re.compile(r'\$?([0-9,.]+)')
 
 import json
 import re
@@ -38,79 +46,8 @@ def extract_numerical_data(text):
     Extract numerical data from text and convert to JSON format.
     Returns a list of dictionaries with context (labels) and values.
     """
-    data = []
-    
-    # Let's try a simple line-by-line approach first
-    lines = text.split('\n')
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-            
-        # Basic pattern for "key: $value" format
-        match = re.search(r'([^:]+):\s*\$?([0-9,.]+)', line)
-        if match:
-            context = match.group(1).strip()
-            value_str = match.group(2).strip()
-            try:
-                # Clean up value by removing commas
-                clean_value = value_str.replace(',', '')
-                value = float(clean_value)
-                data.append({
-                    "context": context,
-                    "value": value
-                })
-                continue  # Move to next line if we found a match
-            except ValueError:
-                pass  # Try other patterns if this fails
-                
-    # If the simple approach failed, try more complex patterns
-    if not data:
-        # Pattern 1: Look for "key: value" or "key - value" formats
-        pattern1 = r'([a-zA-Z0-9\s\-\.,&]+?)[\s]*[:|-][\s]*\$?[\s]*([0-9,]+\.?\d*)'
-        matches1 = re.findall(pattern1, text)
-        
-        # Pattern 2: Look for "value units for key" format (e.g., "10 items for category A")
-        pattern2 = r'(\d+\.?\d*)[\s]+([a-zA-Z]+)[\s]+(?:for|in|of)[\s]+([a-zA-Z0-9\s\-\.,&]+)'
-        matches2 = re.findall(pattern2, text)
-        
-        # Combine matches
-        all_matches = matches1 + [(key, value) for value, unit, key in matches2]
-        
-        # Process matches
-        for context, value in all_matches:
-            try:
-                # Clean up value by removing commas
-                clean_value = value.replace(',', '')
-                numeric_value = float(clean_value)
-                data.append({
-                    "context": context.strip(),
-                    "value": numeric_value
-                })
-            except ValueError:
-                continue
-                
-    # If we still don't have data, try a very basic approach - find any key-value pairs
-    if not data:
-        # Simple pattern for key-value pairs
-        pattern = r'([A-Za-z]+).*?(\d[\d,.]*)'
-        matches = re.findall(pattern, text)
-        
-        for context, value in matches:
-            try:
-                clean_value = value.replace(',', '')
-                numeric_value = float(clean_value)
-                data.append({
-                    "context": context.strip(),
-                    "value": numeric_value
-                })
-            except ValueError:
-                continue
-                
-    # Debug output - uncomment if needed
-    # print(f"Found {len(data)} data points")
-                
-    return data
+    # Linear-time scan with precompiled patterns, see core.extraction
+    return list(iter_records(text))
 
 def text_to_json(text):
     """
@@ -137,20 +74,14 @@ def text_to_json(text):
     # If we found data, return it
     if extracted_data:
         # Remove duplicates (keeping first occurrence)
-        seen_contexts = set()
-        unique_data = []
-        for item in extracted_data:
-            if item["context"] not in seen_contexts:
-                seen_contexts.add(item["context"])
-                unique_data.append(item)
-        return unique_data
+        return unique_records(extracted_data)
     
     # If still no data found, try one more approach: direct parse of specific formats
     if ":" in text:
         data = []
-        lines = [line.strip() for line in text.split('\n') if line.strip()]
         
-        for line in lines:
+        for line in iter_lines(text):
+            line = line.strip()
             if ":" in line:
                 parts = line.split(":", 1)  # Split only on first colon
                 if len(parts) == 2:
@@ -158,7 +89,7 @@ def text_to_json(text):
                     value_part = parts[1].strip()
                     
                     # Extract numbers from value part
-                    number_match = re.search(r'\$?([0-9,.]+)', value_part)
+                    number_match = NUMBER_IN_VALUE.search(value_part)
                     if number_match:
                         try:
                             value_str = number_match.group(1).replace(',', '')
@@ -240,28 +171,44 @@ def index(request):
     return render(request, 'core/index.html')
 
 @csrf_exempt
-def process_text(request):
+async def process_text(request):
     """Process the submitted text and determine visualization"""
     if request.method == 'POST':
         text = request.POST.get('text', '')
         
-        # Extract data from text
-        data = extract_numerical_data(text)
-        
-        if not data:
-            return JsonResponse({'error': 'No numerical data found in the text'})
-        
-        # Use RAG model to determine visualization type
-        viz_type = determine_visualization_type(data)
+        # Serve repeated submissions from the result cache before doing any
+        # work; the key includes the classifier's signature, so a reloaded
+        # model or changed heuristics classify again
+        digest = text_hash(text, classifier_signature())
+        result = await aget_result(digest)
+        if result is not None:
+            data = result['data']
+            viz_type = result['visualization_type']
+        else:
+            # Extract data from text off the event loop, large inputs take a while
+            data = await sync_to_async(extract_numerical_data, thread_sensitive=False)(text)
+            
+            if not data:
+                return JsonResponse({'error': 'No numerical data found in the text'})
+            
+            # Use RAG model to determine visualization type without blocking other requests
+            try:
+                viz_type = await classify_async(data, timeout=getattr(settings, 'RAG_TIMEOUT', None))
+            except asyncio.TimeoutError:
+                print("RAG visualization classification timed out, defaulting to bar chart")
+                viz_type = 'bar'
+                # Timed-out fallbacks are not cached so the next attempt can classify properly
+                result = await astore_payload(text, data, viz_type)
+            else:
+                result = await astore_result(digest, text, data, viz_type)
         
-        # Store the data in session for the visualization view
-        request.session['visualization_data'] = {
-            'data': data,
-            'type': viz_type
-        }
+        # The session only references the stored payload, so its writes stay small
+        await request.session.aset('visualization_id', result['id'])
+        await request.session.apop('visualization_data', None)
         
         return JsonResponse({
             'success': True, 
+            'id': result['id'],
             'data': data, 
             'visualization_type': viz_type,
             'redirect_url': f'/core/{viz_type}/'
@@ -269,18 +216,45 @@ def process_text(request):
     
     return JsonResponse({'error': 'Invalid request method'})
 
-def visualize(request, viz_type):
+def _int_param(request, name, default):
+    try:
+        return int(request.GET.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+async def visualize(request, viz_type):
     """Render the visualization based on type"""
-    viz_data = request.session.get('visualization_data', {})
-    data = viz_data.get('data', [])
-    
+    entry_id = await request.session.aget('visualization_id')
+    payload = await aget_payload(entry_id) if entry_id is not None else None
+    if payload is not None:
+        data = payload['data']
+    else:
+        # sessions written before payloads moved out of the session store
+        viz_data = await request.session.aget('visualization_data', {})
+        data = viz_data.get('data', [])
+
+    # Level of detail: ?points= sets the budget, ?start=&end= a row window
+    max_points = getattr(settings, 'VIZ_MAX_POINT_BUDGET', 20000)
+    points = max(2, min(_int_param(request, 'points', getattr(settings, 'VIZ_POINT_BUDGET', 1000)), max_points))
+    start = max(0, min(len(data), _int_param(request, 'start', 0)))
+    end = max(start, min(len(data), _int_param(request, 'end', len(data))))
+    reduced, window_rows = await sync_to_async(reduce_series, thread_sensitive=False)(data[start:end], viz_type, points)
+
     # Convert data to JSON string for template
-    json_data = json.dumps(data)
-    
+    context = {
+        'json_data': json.dumps(reduced),
+        'total_rows': len(data),
+        'window_rows': window_rows,
+        'shown_rows': len(reduced),
+        'start': start,
+        'end': end,
+        'more_points': min(points * 4, max_points),
+    }
+
     if viz_type == 'bar':
-        return render(request, 'core/bar_chart.html', {'json_data': json_data})
+        return render(request, 'core/bar_chart.html', context)
     elif viz_type == 'line':
-        return render(request, 'core/line_chart.html', {'json_data': json_data})
+        return render(request, 'core/line_chart.html', context)
     else:
         # Default to 3D line chart from your pasted template
-        return render(request, '3d_line_chart.html', {'json_data': json_data})
+        return render(request, '3d_line_chart.html', context)
@@ -131,4 +131,14 @@ STATICFILES_DIRS = [
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
\ No newline at end of file
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+
+# Seconds a request waits for the in-process RAG classifier before falling back
+RAG_TIMEOUT = 10
+
+# Entries kept in the in-memory tier of the process_text result cache
+RESULT_CACHE_SIZE = 256
+
+# Records sent to the 3D charts by default, and the most a client may request
+VIZ_POINT_BUDGET = 1000
+VIZ_MAX_POINT_BUDGET = 20000
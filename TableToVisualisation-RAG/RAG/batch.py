@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import argparse
+import threading
+import traceback
+from contextlib import contextmanager
+from contextvars import ContextVar
+from concurrent.futures import ThreadPoolExecutor
+
+# ------------------------------------------------------------------------------
+# Batch execution with bounded concurrency per backend
+# ------------------------------------------------------------------------------
+# Each item runs through the whole pipeline on a worker thread, so while one
+# item waits on the LLM another can be embedding or plotting. Calls to a
+# backend are wrapped in `slot(name)`; inside a batch, at most that batch's
+# limit of them are in flight at once across its workers. Each batch has its
+# own semaphores, carried to its workers in a context variable, so
+# concurrent batches never share or reset each other's limits. Outside a
+# batch no limit is set and `slot` does nothing.
+CHAT_CONCURRENCY = 4
+EMBED_CONCURRENCY = 8
+
+_limits = ContextVar("batch_limits", default={})
+
+def make_limits(limits: dict) -> dict:
+    """Semaphores per backend name for one batch; None or 0 means no limit"""
+    return {backend: threading.BoundedSemaphore(n) for backend, n in limits.items() if n}
+
+@contextmanager
+def slot(backend: str):
+    """Holds one of `backend`'s in-flight slots for the duration of a call"""
+    semaphore = _limits.get().get(backend)
+    if semaphore is None:
+        yield
+        return
+    with semaphore:
+        yield
+
+def _run_item(fn, index: int, item, limits: dict) -> dict:
+    t0 = time.perf_counter()
+    token = _limits.set(limits)
+    try:
+        result, error = fn(item), None
+    except Exception as e:
+        result = None
+        error = {
+            "type": type(e).__name__,
+            "message": str(e),
+            "traceback": traceback.format_exc(limit=5),
+        }
+    finally:
+        _limits.reset(token)
+    return {
+        "index": index,
+        "input": item,
+        "ok": error is None,
+        "result": result,
+        "error": error,
+        "seconds": time.perf_counter() - t0,
+    }
+
+def run_batch(items, fn, chat_concurrency: int = CHAT_CONCURRENCY,
+              embed_concurrency: int = EMBED_CONCURRENCY, workers: int = None) -> list:
+    """
+    Applies `fn` to every item concurrently and returns one record per item,
+    in input order: {"index", "input", "ok", "result", "error", "seconds"}.
+
+    At most `chat_concurrency` chat and `embed_concurrency` embed calls are
+    in flight at any time. A failing item records its exception and does not
+    affect the others. `workers` defaults to enough threads to keep both
+    backends busy.
+    """
+    items = list(items)
+    workers = workers or chat_concurrency + embed_concurrency
+    limits = make_limits({"chat": chat_concurrency, "embed": embed_concurrency})
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as pool:
+        futures = [pool.submit(_run_item, fn, i, item, limits) for i, item in enumerate(items)]
+        return [f.result() for f in futures]
+
+def summarize(results: list) -> str:
+    failed = [r for r in results if not r["ok"]]
+    return f"{len(results) - len(failed)} succeeded, {len(failed)} failed"
+
+if __name__ == "__main__":
+    # python batch.py prompts.txt|prompts.xlsx --out-dir charts/
+    parser = argparse.ArgumentParser(description="Convert many descriptions to charts with rag_viz_pipeline")
+    parser.add_argument("prompts", help="text file with one description per line, or a sheet with one per row")
+    parser.add_argument("--out-dir", default="batch_charts")
+    parser.add_argument("--format", default="png", choices=["png", "svg"])
+    parser.add_argument("--chat", type=int, default=CHAT_CONCURRENCY, help="chat requests in flight")
+    parser.add_argument("--embed", type=int, default=EMBED_CONCURRENCY, help="embed requests in flight")
+    args = parser.parse_args()
+
+    if args.prompts.endswith((".xlsx", ".xls")):
+        import pandas as pd
+        prompts = pd.read_excel(args.prompts, header=None)[0].dropna().astype(str).tolist()
+    else:
+        with open(args.prompts, encoding="utf-8") as f:
+            prompts = [line.strip() for line in f if line.strip()]
+
+    from rag_viz_pipeline import pipeline_batch
+    t0 = time.perf_counter()
+    results = pipeline_batch(prompts, fmt=args.format, chat_concurrency=args.chat, embed_concurrency=args.embed)
+    elapsed = time.perf_counter() - t0
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    for r in results:
+        if r["ok"]:
+            with open(os.path.join(args.out_dir, f"{r['index']:05d}.{args.format}"), "wb") as f:
+                f.write(r["result"])
+        else:
+            print(f"#{r['index']} failed: {r['error']['type']}: {r['error']['message']}", file=sys.stderr)
+    print(f"{summarize(results)} in {elapsed:.1f}s ({len(results) / elapsed:.1f} items/s)")
@@ -0,0 +1,248 @@
+import io
+import os
+import re
+import sys
+import json
+import time
+import types
+import hashlib
+import argparse
+import tempfile
+import functools
+import contextlib
+from collections import defaultdict
+import numpy as np
+
+# ------------------------------------------------------------------------------
+# End-to-end latency benchmark: text → table → chart
+# ------------------------------------------------------------------------------
+# Replays the User Prompts sheet through rag_viz_pipeline.pipeline with the
+# ollama chat and embed endpoints replaced by a deterministic local stub, and
+# reports p50/p95/p99 per stage plus overall throughput as JSON.
+#
+#   python bench_pipeline.py --chat-latency 0.2 --embed-latency 0.02 --repeat 5
+#
+# By default the feature classifier is switched off, so every prompt goes
+# through the embed, vector query and decision stages; the stub's tables are
+# clear-cut enough that the classifier would otherwise answer all of them.
+# --heuristic keeps it on, as in production.
+#
+# The embedding cache and the Chroma store live in a temporary directory, so
+# stub vectors never reach the real on-disk stores. The first pass runs on
+# cold caches and the later ones on warm caches (embeddings, rendered
+# charts); their percentiles are reported separately.
+HERE = os.path.dirname(os.path.abspath(__file__))
+PROMPTS_PATH = os.path.join(HERE, "..", "..", "User Prompts", "User Prompt.xlsx")
+EMBED_DIM = 768  # nomic-embed-text
+
+# "35 students", "20.5 units": a number and the word after it
+NUMBER_WORD = re.compile(r'(\d+(?:\.\d+)?)\s+([A-Za-z][\w+#]*)')
+
+class StubOllama:
+    """
+    Deterministic stand-in for `ollama.chat` and `ollama.embed`.
+
+    Every call sleeps for the configured latency. Chat turns the numbers of
+    a conversion prompt into a {"label", "value"} table and answers decision
+    prompts with a bar chart over those columns; embeddings are seeded by
+    the sha256 of their text, so reruns produce identical vectors.
+    """
+
+    def __init__(self, chat_latency: float = 0.0, embed_latency: float = 0.0, dim: int = EMBED_DIM):
+        self.chat_latency = chat_latency
+        self.embed_latency = embed_latency
+        self.dim = dim
+
+    def chat(self, model, messages, **kwargs):
+        time.sleep(self.chat_latency)
+        prompt = messages[-1]["content"]
+        if '"chart_type"' in prompt:
+            content = {"chart_type": "bar", "x_column": "label", "y_column": "value"}
+        else:
+            text = prompt.split("TEXT:", 1)[-1]
+            content = [
+                {"label": f"{word} {i}", "value": float(value)}
+                for i, (value, word) in enumerate(NUMBER_WORD.findall(text), start=1)
+            ] or [{"label": "total", "value": 0.0}]
+        return {"message": {"role": "assistant", "content": json.dumps(content)}}
+
+    def embed(self, model, input, **kwargs):
+        time.sleep(self.embed_latency)
+        texts = [input] if isinstance(input, str) else list(input)
+        return types.SimpleNamespace(embeddings=[self._vector(t) for t in texts])
+
+    def _vector(self, text: str) -> list:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        return np.random.default_rng(seed).standard_normal(self.dim).astype("float32").tolist()
+
+class StageTimer:
+    """Collects wall-clock samples per named stage"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def wrap(self, stage: str, fn):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.samples[stage].append(time.perf_counter() - t0)
+        return timed
+
+    def patch(self, module, name: str, stage: str):
+        setattr(module, name, self.wrap(stage, getattr(module, name)))
+
+class _TimedCollection:
+    """Collection proxy timing `query` as the vector_query stage"""
+
+    def __init__(self, collection, timer: StageTimer):
+        self._collection = collection
+        self.query = timer.wrap("vector_query", collection.query)
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+def instrument(pipeline_module, timer: StageTimer):
+    """Wraps each pipeline stage looked up through the module's globals"""
+    timer.patch(pipeline_module, "text_to_json_table", "table_llm")
+    timer.patch(pipeline_module, "embed", "embed")
+    timer.patch(pipeline_module, "parse_table", "parse_table")
+    timer.patch(pipeline_module, "render_chart", "render")
+
+    get_collection = pipeline_module.get_guidelines_collection
+    pipeline_module.get_guidelines_collection = lambda: _TimedCollection(get_collection(), timer)
+
+    # the decision call shares ollama.chat with the table conversion
+    client = pipeline_module.ollama
+    chat = client.chat
+    decision_chat = timer.wrap("decision_llm", chat)
+    def routed_chat(model, messages, **kwargs):
+        if '"chart_type"' in messages[-1]["content"]:
+            return decision_chat(model=model, messages=messages, **kwargs)
+        return chat(model=model, messages=messages, **kwargs)
+    client.chat = routed_chat
+
+def isolate_stores(tmpdir: str):
+    """Points the embedding cache and the Chroma store at `tmpdir`"""
+    import embed_cache
+    import vector_store
+    embed_cache._cache = embed_cache.EmbeddingCache(path=os.path.join(tmpdir, "embed_cache.sqlite3"))
+    vector_store.STORE_DIR = os.path.join(tmpdir, "chroma_store")
+    vector_store._client = None
+
+def load_prompts(path: str = PROMPTS_PATH) -> list:
+    import pandas as pd
+    return pd.read_excel(path, header=None)[0].dropna().astype(str).tolist()
+
+def summarize(samples: dict) -> dict:
+    stats = {}
+    for stage, values in samples.items():
+        ms = np.asarray(values) * 1000
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        stats[stage] = {
+            "count": len(values),
+            "mean_ms": float(ms.mean()),
+            "p50_ms": float(p50),
+            "p95_ms": float(p95),
+            "p99_ms": float(p99),
+        }
+    return stats
+
+def run_benchmark(prompts, repeat: int = 3, fmt: str = "png", chat_latency: float = 0.0,
+                  embed_latency: float = 0.0, live: bool = False, heuristic: bool = False) -> dict:
+    """
+    Runs every prompt `repeat` times through the pipeline and returns the
+    per-stage latency percentiles of the cold first pass and of the warm
+    later passes, the throughput and the failure count. Unless `heuristic`
+    is set the feature classifier never answers, so every prompt goes
+    through the retrieval tier.
+    """
+    if not live:
+        stub = StubOllama(chat_latency, embed_latency)
+        sys.modules["ollama"] = stub
+    import embed_cache
+    import rag_viz_pipeline
+    from chart_heuristics import tier_stats
+    if not live:
+        embed_cache.ollama = stub
+        rag_viz_pipeline.ollama = stub
+
+    timer = StageTimer()
+    passes = {}
+    failures = 0
+    threshold = rag_viz_pipeline.CONFIDENCE_THRESHOLD
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if not live:
+            isolate_stores(tmpdir)
+        instrument(rag_viz_pipeline, timer)
+        if not heuristic:
+            rag_viz_pipeline.CONFIDENCE_THRESHOLD = float("inf")
+
+        t_start = time.perf_counter()
+        for n in range(repeat):
+            if n < 2:
+                # the first pass fills the caches; the later ones share one sample set
+                timer.samples = passes.setdefault("cold" if n == 0 else "warm", defaultdict(list))
+            for prompt in prompts:
+                t0 = time.perf_counter()
+                try:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        rag_viz_pipeline.pipeline(prompt, fmt=fmt)
+                except Exception as e:
+                    failures += 1
+                    print(f"pipeline failed: {e}", file=sys.stderr)
+                    continue
+                timer.samples["total"].append(time.perf_counter() - t0)
+        wall = time.perf_counter() - t_start
+        rag_viz_pipeline.CONFIDENCE_THRESHOLD = threshold
+
+    runs = repeat * len(prompts)
+    return {
+        "config": {
+            "prompts": len(prompts),
+            "repeat": repeat,
+            "format": fmt,
+            "live": live,
+            "heuristic": heuristic,
+            "chat_latency_s": None if live else chat_latency,
+            "embed_latency_s": None if live else embed_latency,
+        },
+        "runs": runs,
+        "failures": failures,
+        "wall_s": wall,
+        "throughput_per_s": (runs - failures) / wall if wall else 0.0,
+        "stages": {name: summarize(samples) for name, samples in passes.items()},
+        "tiers": tier_stats(),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end latency benchmark for rag_viz_pipeline")
+    parser.add_argument("--prompts", default=PROMPTS_PATH)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--format", default="png", choices=["png", "svg"])
+    parser.add_argument("--chat-latency", type=float, default=0.0, help="seconds per stubbed chat call")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="seconds per stubbed embed call")
+    parser.add_argument("--live", action="store_true", help="use the real ollama server and stores")
+    parser.add_argument("--heuristic", action="store_true",
+                        help="let the feature classifier answer confident prompts before retrieval")
+    parser.add_argument("--out", default="bench_pipeline.json")
+    args = parser.parse_args()
+
+    results = run_benchmark(
+        load_prompts(args.prompts), repeat=args.repeat, fmt=args.format,
+        chat_latency=args.chat_latency, embed_latency=args.embed_latency, live=args.live,
+        heuristic=args.heuristic,
+    )
+    print(f"{'pass':<6}{'stage':<14}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stages in results["stages"].items():
+        for stage, s in stages.items():
+            print(f"{name:<6}{stage:<14}{s['count']:>7}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}")
+    for tier, t in results["tiers"].items():
+        print(f"tier {tier:<9}{t['count']:>7} ({t['share']:.0%})")
+    print(f"{results['runs']} runs, {results['failures']} failed, "
+          f"{results['throughput_per_s']:.2f} prompts/s")
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.out}")
@@ -0,0 +1,82 @@
+import re
+import threading
+from collections import Counter
+import pandas as pd
+
+# ------------------------------------------------------------------------------
+# Cheap feature-based chart classifier, tried before the embed/LLM path
+# ------------------------------------------------------------------------------
+# Answers with a confidence in [0, 1]; callers only fall through to retrieval
+# and the decision LLM below CONFIDENCE_THRESHOLD. Every feature is computed
+# with vectorized pandas string/numeric ops over the whole x column.
+CONFIDENCE_THRESHOLD = 0.8
+
+# Month/weekday names, quarters, halves, years and time-unit words
+TIME_LABEL = re.compile(
+    r'(?i)\b(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?'
+    r'|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?'
+    r'|mon(?:day)?|tue(?:sday)?|wed(?:nesday)?|thu(?:rsday)?|fri(?:day)?|sat(?:urday)?|sun(?:day)?'
+    r'|q[1-4]|h[12]|(?:19|20)\d{2}|day|week|month|year|quarter|hour|date|time|period)s?\b'
+)
+
+_tiers = Counter()
+_tiers_lock = threading.Lock()
+
+def record_tier(tier: str):
+    """Counts which tier ("heuristic", "retrieval", ...) answered a request"""
+    with _tiers_lock:
+        _tiers[tier] += 1
+
+def tier_stats() -> dict:
+    """Answer count and share per tier since start-up"""
+    with _tiers_lock:
+        counts = dict(_tiers)
+    total = sum(counts.values())
+    return {tier: {"count": n, "share": n / total} for tier, n in counts.items()}
+
+def classify_labels(labels: pd.Series, column_name: str = None):
+    """
+    ("line" | "bar", confidence) from the x labels of a chart.
+
+    Mostly date-like labels, or numeric labels in monotonic order, mean a
+    line chart; distinct non-numeric, non-temporal categories a bar chart.
+    Fewer than three points and mixed signals get a low confidence.
+    """
+    n = len(labels)
+    if n < 3:
+        return "bar", 0.5
+
+    text = labels.astype(str).str.strip()
+    time_ratio = float(text.str.contains(TIME_LABEL).mean())
+    if column_name and TIME_LABEL.search(str(column_name)):
+        time_ratio = max(time_ratio, 0.8)
+    numeric = pd.to_numeric(text.str.replace(",", "", regex=False), errors="coerce")
+    numeric_ratio = float(numeric.notna().mean())
+    distinct = text.nunique() == n
+
+    if time_ratio >= 0.8:
+        return "line", 0.8 + 0.2 * time_ratio
+    if numeric_ratio == 1 and distinct and (numeric.is_monotonic_increasing or numeric.is_monotonic_decreasing):
+        return "line", 0.9
+    if time_ratio == 0 and numeric_ratio == 0:
+        # repeated categories suggest a grouped table the model handles better
+        return "bar", 0.9 if distinct else 0.7
+    return ("line" if time_ratio >= 0.5 else "bar"), 0.5
+
+def classify_table(df: pd.DataFrame):
+    """
+    (chart_type, x_column, y_column, confidence) for a flattened table.
+
+    x is the first non-numeric column (the first column if all are
+    numeric) and y the first numeric column after it; a table without a
+    numeric y column gets confidence 0.
+    """
+    if df.empty or len(df.columns) < 2:
+        return "bar", None, None, 0.0
+    numeric_cols = [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c])]
+    x_col = next((c for c in df.columns if c not in numeric_cols), df.columns[0])
+    y_col = next((c for c in numeric_cols if c != x_col), None)
+    if y_col is None:
+        return "bar", x_col, None, 0.0
+    chart_type, confidence = classify_labels(df[x_col], x_col)
+    return chart_type, x_col, y_col, confidence
@@ -0,0 +1,121 @@
+import io
+import json
+import queue
+import hashlib
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+# ------------------------------------------------------------------------------
+# Headless (Agg) chart rendering to PNG/SVG bytes
+# ------------------------------------------------------------------------------
+# Figures are created through matplotlib.figure directly, never via pyplot, so
+# no display is needed and nothing is registered in pyplot's global figure list.
+# matplotlib itself is only imported when the first figure is created.
+POOL_SIZE = 4
+CACHE_SIZE = 128
+FIGSIZE = (8, 5)
+
+def draw_chart(ax, x_values, y_values, chart_type: str, x_label: str, y_label: str, title: str = None):
+    """Draws a bar or line chart on `ax`; shared by the headless and interactive paths"""
+    if chart_type.lower() == "line":
+        ax.plot(x_values, y_values, marker="o")
+    else:
+        ax.bar(x_values, y_values)
+    ax.set_xlabel(x_label)
+    ax.set_ylabel(y_label)
+    ax.set_title(title or f"{chart_type.title()} of {y_label} vs {x_label}")
+    for label in ax.get_xticklabels():
+        label.set_rotation(45)
+        label.set_horizontalalignment("right")
+
+class ChartRenderer:
+    """
+    Renders (data, chart_type, x, y) specs to image bytes.
+
+    Up to `pool_size` Figure objects are reused between renders, and the
+    bytes of the last `cache_size` distinct specs are kept, keyed by a hash
+    of the spec, so repeated requests do not redraw at all.
+    """
+
+    def __init__(self, pool_size: int = POOL_SIZE, cache_size: int = CACHE_SIZE, figsize=FIGSIZE):
+        self.figsize = figsize
+        self.cache_size = cache_size
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def spec_key(df: pd.DataFrame, chart_type: str, x: str, y: str, fmt: str, labels) -> str:
+        h = hashlib.sha256()
+        h.update(json.dumps([chart_type, x, y, fmt, labels], default=str).encode("utf-8"))
+        h.update(pd.util.hash_pandas_object(df[[x, y]], index=False).values.tobytes())
+        return h.hexdigest()
+
+    def _acquire(self):
+        try:
+            fig = self._pool.get_nowait()
+            fig.clear()
+            return fig
+        except queue.Empty:
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            fig = Figure(figsize=self.figsize)
+            FigureCanvasAgg(fig)
+            return fig
+
+    def _release(self, fig):
+        try:
+            self._pool.put_nowait(fig)
+        except queue.Full:
+            # pool is full: drop the figure and its artists
+            fig.clear()
+
+    def render(self, data, chart_type: str, x: str, y: str, fmt: str = "png",
+               title: str = None, x_label: str = None, y_label: str = None) -> bytes:
+        df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+        key = self.spec_key(df, chart_type, x, y, fmt, [title, x_label, y_label])
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+
+        fig = self._acquire()
+        try:
+            ax = fig.add_subplot()
+            draw_chart(ax, df[x], df[y], chart_type, x_label or x, y_label or y, title)
+            fig.tight_layout()
+            buf = io.BytesIO()
+            fig.savefig(buf, format=fmt)
+            payload = buf.getvalue()
+        finally:
+            self._release(fig)
+
+        with self._lock:
+            self._cache[key] = payload
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return payload
+
+_renderer = ChartRenderer()
+
+def render_chart(data, chart_type: str, x: str, y: str, fmt: str = "png",
+                 title: str = None, x_label: str = None, y_label: str = None) -> bytes:
+    """PNG or SVG bytes for a chart spec, using the shared pooled renderer"""
+    return _renderer.render(data, chart_type, x, y, fmt=fmt, title=title, x_label=x_label, y_label=y_label)
+
+def show_chart(data, chart_type: str, x: str, y: str, title: str = None, x_label: str = None, y_label: str = None, figsize=FIGSIZE):
+    """Interactive pyplot window for CLI use; the figure is closed once shown"""
+    import matplotlib.pyplot as plt
+    df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+    fig = plt.figure(figsize=figsize)
+    try:
+        draw_chart(fig.gca(), df[x], df[y], chart_type, x_label or x, y_label or y, title)
+        fig.tight_layout()
+        plt.show()
+    finally:
+        plt.close(fig)
@@ -0,0 +1,65 @@
+import os
+import time
+import argparse
+import pandas as pd
+from faiss_store import MODEL_NAME, load_index, search_many
+from model_registry import get_sentence_encoder
+from dataset_cache import get_or_load_for_sheet, load_sheet
+
+# ------------------------------------------------------------------------------
+# Bulk chart-type classification of a corpus of user prompts
+# ------------------------------------------------------------------------------
+HERE = os.path.dirname(os.path.abspath(__file__))
+SHEET_PATH = os.path.join(HERE, "rag_training_data.xlsx")
+PROMPTS_PATH = os.path.join(HERE, "..", "..", "User Prompts", "User Prompt.xlsx")
+
+def load_prompts(path: str = PROMPTS_PATH) -> list:
+    """One prompt per row of the sheet's first column (the sheet has no header)"""
+    return pd.read_excel(path, header=None)[0].dropna().astype(str).tolist()
+
+def classify_prompts(prompts, sheet_path: str = SHEET_PATH, k: int = 1, batch_size: int = 256) -> pd.DataFrame:
+    """
+    Top-k training rows for every prompt with their chart type and scale.
+
+    All prompts are encoded in batches and looked up in a single FAISS
+    search, so throughput is bound by the encoder rather than per-call cost.
+    """
+    df = get_or_load_for_sheet(("sheet", sheet_path), sheet_path, lambda: load_sheet(sheet_path))
+    model = get_sentence_encoder(MODEL_NAME)
+    index = get_or_load_for_sheet(("faiss", sheet_path), sheet_path, lambda: load_index(sheet_path, lambda: model))
+
+    D, I = search_many(index, model, prompts, k=k, batch_size=batch_size)
+    rows = []
+    for prompt, distances, ids in zip(prompts, D, I):
+        for rank, (distance, i) in enumerate(zip(distances, ids), start=1):
+            if i == -1:
+                continue
+            match = df.iloc[i]
+            rows.append({
+                "prompt": prompt,
+                "rank": rank,
+                "row": int(i),
+                "distance": float(distance),
+                "description": match["Description"],
+                "visualisation_type": match["Visualisation Type"],
+                "scale": match["Scale"],
+            })
+    return pd.DataFrame(rows)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Classify a sheet of user prompts by nearest training example")
+    parser.add_argument("--prompts", default=PROMPTS_PATH)
+    parser.add_argument("--sheet", default=SHEET_PATH)
+    parser.add_argument("-k", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--out", help="write the results to this CSV file")
+    args = parser.parse_args()
+
+    prompts = load_prompts(args.prompts)
+    t0 = time.perf_counter()
+    results = classify_prompts(prompts, args.sheet, k=args.k, batch_size=args.batch_size)
+    elapsed = time.perf_counter() - t0
+    print(results[["rank", "visualisation_type", "distance", "prompt"]].to_string(index=False, max_colwidth=60))
+    print(f"\n{len(prompts)} prompts in {elapsed:.2f}s ({len(prompts) / elapsed:.1f} prompts/s)")
+    if args.out:
+        results.to_csv(args.out, index=False)
@@ -0,0 +1,122 @@
+import os
+import sys
+import json
+import time
+import pandas as pd
+from model_registry import get_or_load, register
+from persist import file_hash, source_key, replace_atomically, read_json, write_json
+
+# ------------------------------------------------------------------------------
+# Columnar (Arrow IPC) cache in front of pd.read_excel
+# ------------------------------------------------------------------------------
+# Each sheet is parsed by openpyxl once and written uncompressed to
+# dataset_cache/, keyed by its absolute path. Later loads memory-map that file
+# instead. The manifest next to it records the source size, mtime and sha256:
+# an unchanged mtime skips hashing, and a touched but identical file is not
+# converted again.
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dataset_cache")
+
+def _paths(path: str):
+    base = os.path.join(CACHE_DIR, source_key(path))
+    return base + ".arrow", base + ".manifest.json"
+
+def _arrow_safe(df: pd.DataFrame) -> pd.DataFrame:
+    """String column names, and mixed-type object columns stored as strings"""
+    df = df.rename(columns=str)
+    for col in df.columns:
+        if df[col].dtype == object:
+            values = df[col].dropna()
+            if len(set(map(type, values))) > 1:
+                df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+def _convert(path: str, arrow_path: str):
+    from pyarrow import feather
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    df = _arrow_safe(pd.read_excel(path))
+    replace_atomically(arrow_path, lambda tmp: feather.write_feather(df, tmp, compression="uncompressed"))
+
+def _refresh(path: str):
+    """
+    Converts the sheet again if its content changed since the last
+    conversion and returns (arrow_path, sha256 of the sheet).
+    """
+    arrow_path, manifest_path = _paths(path)
+    stat = os.stat(path)
+    manifest = read_json(manifest_path)
+
+    digest = None
+    if manifest is None or not os.path.exists(arrow_path) or manifest.get("size") != stat.st_size:
+        fresh = False
+    elif manifest.get("mtime_ns") == stat.st_mtime_ns:
+        fresh = True
+        digest = manifest.get("sha256")
+    else:
+        digest = file_hash(path)
+        fresh = manifest.get("sha256") == digest
+
+    if not fresh or manifest.get("mtime_ns") != stat.st_mtime_ns:
+        digest = digest or file_hash(path)
+        if not fresh:
+            print(f"Converting {path} to {arrow_path}")
+            _convert(path, arrow_path)
+        write_json(manifest_path, {
+            "source": os.path.abspath(path),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": digest,
+        })
+
+    return arrow_path, digest
+
+def sheet_signature(path: str) -> str:
+    """sha256 of the sheet, from the cache manifest while its mtime is unchanged"""
+    return _refresh(path)[1]
+
+def load_sheet(path: str, columns=None) -> pd.DataFrame:
+    """
+    First sheet of the Excel file at `path` as a DataFrame, optionally
+    restricted to `columns`, read from the memory-mapped columnar copy.
+    """
+    from pyarrow import feather
+    arrow_path, _ = _refresh(path)
+    return feather.read_table(arrow_path, columns=columns, memory_map=True).to_pandas()
+
+def get_or_load_for_sheet(key, path: str, loader):
+    """
+    get_or_load for an object derived from the sheet at `path` (the sheet
+    itself, its parsed tables, an index over it). The entry remembers the
+    sheet signature it was loaded from and is loaded again, replacing the
+    old one, once the sheet's content changes.
+    """
+    signature = sheet_signature(path)
+    loaded_from, obj = get_or_load(key, lambda: (signature, loader()))
+    if loaded_from != signature:
+        loaded_from, obj = register(key, (signature, loader()))
+    return obj
+
+def load_tables(path: str, column: str = "Table") -> list:
+    """
+    The JSON `column` of every row, parsed once per version of the sheet
+    and shared via the model registry; rows whose cell is not valid JSON
+    are None.
+    """
+    def parse():
+        tables = []
+        for raw in load_sheet(path, columns=[column])[column]:
+            try:
+                tables.append(json.loads(raw))
+            except (TypeError, ValueError):
+                tables.append(None)
+        return tables
+    return get_or_load_for_sheet(("tables", os.path.abspath(path), column), path, parse)
+
+if __name__ == "__main__":
+    # python dataset_cache.py <sheet.xlsx>: read_excel vs the cached copy
+    path = sys.argv[1]
+    for label, read in [("read_excel", lambda: pd.read_excel(path)), ("load_sheet", lambda: load_sheet(path))]:
+        read()
+        t0 = time.perf_counter()
+        for _ in range(5):
+            df = read()
+        print(f"{label:<12} {(time.perf_counter() - t0) / 5 * 1000:8.1f} ms  {df.shape}")
@@ -0,0 +1,141 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+import ollama
+from batch import slot
+
+# ------------------------------------------------------------------------------
+# Content-addressed, disk-backed cache in front of ollama.embed
+# ------------------------------------------------------------------------------
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "embed_cache.sqlite3")
+MAX_ENTRIES = 100_000
+EVICT_TO = 0.9   # an overflowing cache is trimmed to this fraction of MAX_ENTRIES
+
+class EmbeddingCache:
+    """
+    Maps (model name, sha256 of input) to a float32 vector stored as a BLOB.
+
+    Once the cache holds more than `max_entries` vectors, the least
+    recently used ones are evicted down to EVICT_TO of it, so a full cache
+    is not trimmed again on every insert. `hits` and `misses` count lookups
+    since start-up.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, digest TEXT NOT NULL, vector BLOB NOT NULL,"
+            " last_used INTEGER NOT NULL, PRIMARY KEY (model, digest))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings (last_used)")
+        self._conn.commit()
+        # an upper bound on the row count: replaced rows are counted again
+        (self._count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+
+    @staticmethod
+    def digest(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, texts):
+        """Cached vectors for `texts` in order, None where there is no entry"""
+        digests = [self.digest(t) for t in texts]
+        found = {}
+        with self._lock:
+            # stay well below SQLite's bound-parameter limit
+            for start in range(0, len(digests), 500):
+                chunk = digests[start:start + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT digest, vector FROM embeddings WHERE model = ? AND digest IN ({marks})",
+                    [model, *chunk]
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time_ns()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND digest = ?",
+                    [(now, model, d) for d in found]
+                )
+                self._conn.commit()
+            hits = sum(d in found for d in digests)
+            self.hits += hits
+            self.misses += len(digests) - hits
+        return [
+            np.frombuffer(found[d], dtype=np.float32).tolist() if d in found else None
+            for d in digests
+        ]
+
+    def put_many(self, model: str, texts, vectors):
+        """Store one vector per text and evict the least recently used overflow"""
+        now = time.time_ns()
+        rows = [
+            (model, self.digest(t), np.asarray(v, dtype=np.float32).tobytes(), now)
+            for t, v in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self._count += len(rows)
+            if self._count > self.max_entries:
+                # only counted exactly once the estimate passes the limit
+                (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+                if count > self.max_entries:
+                    keep = int(self.max_entries * EVICT_TO)
+                    self._conn.execute(
+                        "DELETE FROM embeddings WHERE rowid IN "
+                        "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                        (count - keep,)
+                    )
+                    count = keep
+                self._count = count
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache() -> EmbeddingCache:
+    """Process-wide cache shared by every embedding call site"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache()
+    return _cache
+
+def embed(model: str, inputs):
+    """
+    Drop-in for `ollama.embed(model=..., input=...).embeddings`.
+    Only inputs missing from the cache are sent to the model, in one request.
+    """
+    texts = [inputs] if isinstance(inputs, str) else list(inputs)
+    cache = get_cache()
+    vectors = cache.get_many(model, texts)
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        # identical texts in one call are only embedded once
+        todo = list(dict.fromkeys(texts[i] for i in missing))
+        with slot("embed"):
+            fresh = dict(zip(todo, ollama.embed(model=model, input=todo).embeddings))
+        # rounded like the stored copies, so a hit returns the same vector
+        fresh = {t: np.asarray(v, dtype=np.float32).tolist() for t, v in fresh.items()}
+        cache.put_many(model, todo, [fresh[t] for t in todo])
+        for i in missing:
+            vectors[i] = fresh[texts[i]]
+    return vectors
@@ -1,46 +1,49 @@
 
 import pandas as pd
-import numpy as np
-import faiss
-import json
-import matplotlib.pyplot as plt
-from sentence_transformers import SentenceTransformer
-from transformers import GPT2LMHeadModel, GPT2Tokenizer
+from faiss_store import MODEL_NAME, load_index, search_many
+from model_registry import get_sentence_encoder
+from dataset_cache import get_or_load_for_sheet, load_sheet, load_tables
+from chart_render import render_chart, show_chart
 
 # Load your dataset
 file_path = 'C:/Users/Prachi/OneDrive/Desktop/rag/rag_training_data.xlsx'
-df = pd.read_excel(file_path)
 
-# Step 1: Generate Embeddings for Descriptions using Sentence-BERT
-model = SentenceTransformer('paraphrase-MiniLM-L6-v2')
+# Dataset, encoder and index are loaded on first use and shared via the
+# model registry, so importing this module does not load any of them; the
+# dataset and index are reloaded together once the sheet's content changes
+def get_dataset():
+    return get_or_load_for_sheet(("sheet", file_path), file_path, lambda: load_sheet(file_path))
 
-# Generate embeddings for the descriptions
-descriptions = df['Description'].tolist()
-description_embeddings = model.encode(descriptions)
+# Step 1: Sentence-BERT model for encoding queries
+def get_model():
+    return get_sentence_encoder(MODEL_NAME)
 
-# Convert embeddings to float32 as FAISS requires this format
-description_embeddings = np.array(description_embeddings).astype('float32')
+# Step 2: Load the FAISS index built from the descriptions; it is memory-mapped
+# from disk and only re-encoded when the sheet's content hash changes
+def get_faiss_index():
+    return get_or_load_for_sheet(("faiss", file_path), file_path, lambda: load_index(file_path, get_model))
 
-# Step 2: Build FAISS Index
-faiss_index = faiss.IndexFlatL2(description_embeddings.shape[1])  # L2 distance for similarity search
-faiss_index.add(description_embeddings)  # Add embeddings to the index
+# Step 3: Retrieve relevant descriptions for a batch of queries
+def retrieve_many(queries, k=1, batch_size=256):
+    # Encode all queries in batches and search the FAISS index once
+    D, I = search_many(get_faiss_index(), get_model(), queries, k=k, batch_size=batch_size)
 
-# Step 3: Retrieve relevant description for the user's query
+    # Top-k (description, row index, L2 distance) per query, nearest first
+    descriptions = get_dataset()['Description']
+    return [
+        [(descriptions.iloc[i], int(i), float(d)) for d, i in zip(distances, ids) if i != -1]
+        for distances, ids in zip(D, I)
+    ]
+
+# Retrieve relevant description for the user's query
 def retrieve_relevant_description(query):
-    # Convert the query into an embedding
-    query_embedding = model.encode([query])
-    
-    # Search for the closest match using FAISS
-    D, I = faiss_index.search(np.array(query_embedding).astype('float32'), k=1)  # Retrieve top 1 match
-    
-    # Get the most relevant description from the dataset
-    relevant_description = descriptions[I[0][0]]
-    return relevant_description, I[0][0]
+    relevant_description, index, _ = retrieve_many([query], k=1)[0][0]
+    return relevant_description, index
 
 # Step 4: Extract Visualization Type and Scale Information
 def extract_visualization_info(index):
     # Get the row based on the index
-    row = df.iloc[index]
+    row = get_dataset().iloc[index]
     
     # Extract chart type and scale
     vis_type = row['Visualisation Type']
@@ -49,9 +52,10 @@ def extract_visualization_info(index):
     return vis_type, scale
 
 # Step 5: Generate Visualization based on Chart Type and Scale
-def generate_visualization(index, vis_type, scale):
-    # Extract relevant data from the "Table" column (in JSON format)
-    data = json.loads(df.loc[index, 'Table'])
+def generate_visualization(index, vis_type, scale, fmt=None):
+    # Relevant data from the "Table" column, parsed once per process
+    df = get_dataset()
+    data = load_tables(file_path)[index]
     x_values = [entry[list(entry.keys())[0]] for entry in data]
     y_values = [entry[list(entry.keys())[1]] for entry in data]
     
@@ -59,20 +63,13 @@ def generate_visualization(index, vis_type, scale):
     print(f"Scale Info: {scale}")
     
     # Create a Bar or Line chart based on the Visualisation Type
-    plt.figure(figsize=(8, 6))
-    if vis_type.lower() == 'line':
-        plt.plot(x_values, y_values, marker='o')
-        plt.title("Line Chart")
-    elif vis_type.lower() == 'bar':
-        plt.bar(x_values, y_values)
-        plt.title("Bar Chart")
-    
-    # Add labels and show the chart
-    plt.xlabel(df.loc[index, 'X-Axis Label'])
-    plt.ylabel(df.loc[index, 'Y-Axis Label'])
-    plt.xticks(rotation=45, ha='right')
-    plt.tight_layout()
-    plt.show()
+    chart = pd.DataFrame({'x': x_values, 'y': y_values})
+    title = f"{vis_type.title()} Chart"
+    x_label, y_label = df.loc[index, 'X-Axis Label'], df.loc[index, 'Y-Axis Label']
+    if fmt:
+        # headless PNG/SVG bytes, e.g. for serving over HTTP
+        return render_chart(chart, vis_type.lower(), 'x', 'y', fmt=fmt, title=title, x_label=x_label, y_label=y_label)
+    show_chart(chart, vis_type.lower(), 'x', 'y', title=title, x_label=x_label, y_label=y_label, figsize=(8, 6))
 
 # Step 6: Combine Everything into a User Query Process
 def process_query():
@@ -91,5 +88,6 @@ def process_query():
     # Step 6.3: Generate the corresponding visualization
     generate_visualization(index, vis_type, scale)
 
-# Run the process_query function to interact with the user
-process_query()
+if __name__ == "__main__":
+    # Run the process_query function to interact with the user
+    process_query()
@@ -0,0 +1,180 @@
+import os
+import sys
+import json
+import math
+import numpy as np
+from dataset_cache import load_sheet, sheet_signature
+from persist import source_key, replace_atomically, read_json, write_json
+
+# ------------------------------------------------------------------------------
+# Persisted FAISS index over the dataset's 'Description' column
+# ------------------------------------------------------------------------------
+# faiss is imported inside the functions that use it, so importing this module
+# (e.g. for MODEL_NAME) stays cheap until an index is actually built or loaded.
+INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "faiss_index")
+MODEL_NAME = "paraphrase-MiniLM-L6-v2"
+
+# Above this many descriptions an approximate index replaces the exact one
+APPROX_THRESHOLD = 50_000
+APPROX_KIND = "hnsw"     # "hnsw" or "ivf"
+HNSW_M = 32              # graph degree; higher = better recall, more memory
+HNSW_EF_SEARCH = 64      # search breadth; raise for recall, lower for speed
+IVF_NPROBE = 16          # lists visited per query; raise for recall
+
+def _paths(excel_path: str, name: str = None):
+    """Index, embeddings and manifest paths; one set per sheet unless `name` is given"""
+    base = os.path.join(INDEX_DIR, name or source_key(excel_path))
+    return base + ".index", base + ".npy", base + ".manifest.json"
+
+def _resolve_kind(kind: str, rows: int) -> str:
+    if kind == "auto":
+        return "flat" if rows < APPROX_THRESHOLD else APPROX_KIND
+    return kind
+
+def _make_index(embeddings: np.ndarray, kind: str):
+    import faiss
+    n, dim = embeddings.shape
+    kind = _resolve_kind(kind, n)
+
+    if kind == "flat":
+        index = faiss.IndexFlatL2(dim)  # exact L2 search
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, HNSW_M)
+    elif kind == "ivf":
+        nlist = max(1, int(4 * math.sqrt(n)))
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        index.train(embeddings)
+    else:
+        raise ValueError(f"Unknown index kind: {kind}")
+    index.add(embeddings)
+    return index, kind
+
+def set_search_params(index, ef_search: int = HNSW_EF_SEARCH, nprobe: int = IVF_NPROBE):
+    """Applies the recall/latency knobs of approximate indexes; no-op for flat ones"""
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+    if hasattr(index, "nprobe"):
+        index.nprobe = nprobe
+
+def search_many(index, encoder, queries, k: int = 1, batch_size: int = 256):
+    """
+    Top-k (distances, ids) arrays for every query, nearest first.
+
+    Queries are encoded `batch_size` at a time and searched in one call, so
+    a backlog pays for the encoder, not for per-query overhead. Missing
+    neighbours (fewer than `k` indexed vectors) have id -1.
+    """
+    queries = list(queries)
+    if not queries:
+        return np.empty((0, k), dtype="float32"), np.empty((0, k), dtype="int64")
+    embeddings = np.asarray(encoder.encode(queries, batch_size=batch_size), dtype="float32")
+    return index.search(embeddings, k)
+
+def build_index(excel_path: str, model, name: str = None, kind: str = "auto", embeddings: np.ndarray = None) -> dict:
+    """
+    Encodes every description in `excel_path` with `model` and writes the
+    embeddings (.npy), the FAISS index and a manifest to INDEX_DIR. Passing
+    the sheet's saved `embeddings` instead skips the sheet and the encoder
+    and only rebuilds the index.
+
+    Each file is written to a temporary name and moved into place, and the
+    old manifest is removed first, so a crash midway leaves no manifest
+    describing files it did not produce.
+    """
+    import faiss
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    index_path, emb_path, manifest_path = _paths(excel_path, name)
+
+    source_hash = sheet_signature(excel_path)
+    reused = embeddings is not None
+    if not reused:
+        descriptions = load_sheet(excel_path, columns=["Description"])["Description"].astype(str).tolist()
+        embeddings = np.asarray(model.encode(descriptions, batch_size=256), dtype="float32")
+    index, resolved = _make_index(embeddings, kind)
+
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    def save_embeddings(path):
+        with open(path, "wb") as f:
+            np.save(f, embeddings)
+
+    if not reused:
+        replace_atomically(emb_path, save_embeddings)
+    replace_atomically(index_path, lambda path: faiss.write_index(index, path))
+    manifest = {
+        "source": os.path.abspath(excel_path),
+        "source_hash": source_hash,
+        "model": MODEL_NAME,
+        "rows": int(embeddings.shape[0]),
+        "dim": int(embeddings.shape[1]),
+        "requested_kind": kind,
+        "approx_threshold": APPROX_THRESHOLD,
+        "kind": resolved,
+    }
+    write_json(manifest_path, manifest)
+    return manifest
+
+def _is_stale(manifest, index_path: str, kind: str, source_hash: str) -> bool:
+    """Whether the manifest no longer matches the sheet, encoder or requested index"""
+    if manifest is None or not os.path.exists(index_path):
+        return True
+    if manifest.get("model") != MODEL_NAME or manifest.get("requested_kind") != kind:
+        return True
+    if kind == "auto" and manifest.get("approx_threshold") != APPROX_THRESHOLD:
+        return True
+    if manifest.get("kind") != _resolve_kind(kind, manifest.get("rows", 0)):
+        return True
+    return manifest.get("source_hash") != source_hash
+
+def _saved_embeddings(manifest, emb_path: str, source_hash: str):
+    """The embeddings of an earlier build from the same sheet and encoder, or None"""
+    if manifest is None or manifest.get("model") != MODEL_NAME or manifest.get("source_hash") != source_hash:
+        return None
+    try:
+        embeddings = np.load(emb_path)
+    except (OSError, ValueError):
+        return None
+    if embeddings.shape != (manifest.get("rows"), manifest.get("dim")):
+        return None
+    return embeddings.astype("float32", copy=False)
+
+def load_index(excel_path: str, model_factory, name: str = None, kind: str = "auto"):
+    """
+    Returns the persisted index for `excel_path`, memory-mapped from disk.
+
+    The index is rebuilt first only when the manifest is missing, the
+    sheet's content changed, or the requested kind or APPROX_THRESHOLD
+    differ from those it was built with. Only a new sheet or encoder calls
+    `model_factory()` and re-encodes the descriptions; otherwise the saved
+    embeddings are indexed again, and a warm start touches neither.
+    """
+    import faiss
+    index_path, emb_path, manifest_path = _paths(excel_path, name)
+    manifest = read_json(manifest_path)
+    source_hash = sheet_signature(excel_path)
+
+    if _is_stale(manifest, index_path, kind, source_hash):
+        embeddings = _saved_embeddings(manifest, emb_path, source_hash)
+        if embeddings is None:
+            print(f"Building FAISS index for {excel_path}")
+            manifest = build_index(excel_path, model_factory(), name=name, kind=kind)
+        else:
+            print(f"Rebuilding FAISS index for {excel_path} from saved embeddings")
+            manifest = build_index(excel_path, None, name=name, kind=kind, embeddings=embeddings)
+
+    try:
+        index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        # not every index type supports mmap
+        index = faiss.read_index(index_path)
+    set_search_params(index)
+    return index
+
+if __name__ == "__main__":
+    # Build step: python faiss_store.py <rag_training_data.xlsx> [flat|hnsw|ivf|auto]
+    from sentence_transformers import SentenceTransformer
+    path = sys.argv[1]
+    manifest = build_index(path, SentenceTransformer(MODEL_NAME), kind=sys.argv[2] if len(sys.argv) > 2 else "auto")
+    print(json.dumps(manifest, indent=2))
@@ -0,0 +1,199 @@
+import json
+import time
+from itertools import chain
+import numpy as np
+import pandas as pd
+
+# ------------------------------------------------------------------------------
+# Columnar flattening of nested JSON tables straight into a DataFrame
+# ------------------------------------------------------------------------------
+# below this many output rows the per-record loop beats the columnar path
+SMALL_TABLE_ROWS = 1_500
+
+def _nested_column(df: pd.DataFrame):
+    """First column holding lists or dicts, with the set of value types in it"""
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        kinds = set(map(type, df[col].values))
+        if list in kinds or dict in kinds:
+            return col, kinds
+    return None, None
+
+def _merge(base: pd.DataFrame, sub: pd.DataFrame, parent: str, prefix_all: bool) -> pd.DataFrame:
+    """
+    Columns of `sub`, flattened from the `parent` field, next to the `base`
+    rows they came from.
+
+    `sub.index` holds positions into `base`; the result keeps the index
+    labels of `base`. Columns are named "parent.key" when `prefix_all` is
+    set (object fields, as in pd.json_normalize) or when the bare key is
+    already a column (list fields), so no values are overwritten.
+    """
+    base = base.take(sub.index.to_numpy())
+    labels = base.index
+    base = base.reset_index(drop=True)
+    sub = sub.reset_index(drop=True)
+    names = {k: f"{parent}.{k}" if prefix_all or k in base.columns else k for k in sub.columns}
+    clashes = sorted(set(names.values()) & set(base.columns))
+    if clashes:
+        raise ValueError(f"Nested field {parent!r} collides with columns {clashes}")
+    merged = pd.concat([base, sub.rename(columns=names)], axis=1)
+    merged.index = labels
+    return merged
+
+def _flatten_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Flattens `df` one nested column at a time. The index labels of the
+    result point back at the rows of `df` each output row came from.
+    """
+    while True:
+        col, kinds = _nested_column(df)
+        if col is None:
+            return df
+        values = df[col].values
+        base = df.drop(columns=[col])
+
+        is_list = list in kinds
+        if is_list:
+            # one output row per list element; non-list cells stay a single row
+            lengths = np.fromiter(
+                (len(v) if type(v) is list else 1 for v in values),
+                dtype=np.int64, count=len(values)
+            )
+            items = list(chain.from_iterable(v if type(v) is list else (v,) for v in values))
+            base = base.take(np.repeat(np.arange(len(df)), lengths))
+        else:
+            items = list(values)
+
+        if all(type(v) is dict for v in items):
+            df = _merge(base, _flatten_frame(pd.DataFrame(items)), col, not is_list)
+        elif any(type(v) is dict for v in items):
+            rest = [None if type(v) is dict else v for v in items]
+            # keep the column only if it still has scalar values besides the objects
+            if not pd.isna(pd.Series(rest, dtype=object)).all():
+                base[col] = rest
+            sub = _flatten_frame(pd.DataFrame([v if type(v) is dict else {} for v in items]))
+            df = _merge(base, sub, col, not is_list)
+        else:
+            base[col] = items
+            df = base
+
+def _flatten_records(data):
+    """
+    flatten_table for the common case, built with the per-record loop
+    rag_and_plot used before: up to SMALL_TABLE_ROWS rows from records with
+    the same keys, each holding one non-empty list of flat objects that
+    share their keys too, with no nulls and no key both outside and inside
+    the list. None for any other table.
+    """
+    if not data or type(data[0]) is not dict:
+        return None
+    keys = list(data[0])
+    nested = [k for k in keys if type(data[0][k]) in (list, dict)]
+    if not nested:
+        # a plain table; pd.DataFrame handles it either way
+        return None
+    list_key = nested[0]
+    if len(nested) > 1 or type(data[0][list_key]) is not list:
+        return None
+    if len(data) * len(data[0][list_key]) > SMALL_TABLE_ROWS:
+        return None
+    parent = [k for k in keys if k != list_key]
+
+    sub_keys = None
+    flat = []
+    for d in data:
+        if type(d) is not dict or list(d) != keys or type(d[list_key]) is not list or not d[list_key]:
+            return None
+        base = {k: d[k] for k in parent}
+        if any(v is None or type(v) in (list, dict) for v in base.values()):
+            return None
+        for sub in d[list_key]:
+            if type(sub) is not dict:
+                return None
+            if sub_keys is None:
+                sub_keys = list(sub)
+                if set(sub_keys) & set(parent):
+                    return None
+            if list(sub) != sub_keys or any(v is None or type(v) in (list, dict) for v in sub.values()):
+                return None
+            flat.append({**base, **sub})
+        if len(flat) > SMALL_TABLE_ROWS:
+            return None
+    return pd.DataFrame(flat)
+
+def flatten_table(data) -> pd.DataFrame:
+    """
+    Normalises a (possibly nested) JSON table into a flat DataFrame.
+
+    Every list field is exploded into one row per element, so several list
+    fields in the same record yield their cross product, and every object
+    field (including the elements of exploded lists) is spread into columns.
+    Keys of object fields become "field.key" columns, as in
+    pd.json_normalize; keys of list elements keep their own name unless a
+    column of that name already exists, in which case they are prefixed the
+    same way. Records whose nested list is empty produce no rows. Parent columns are repeated with
+    numpy indexing and nested records become columns in one DataFrame
+    construction per level, so no merged per-row dicts are built; small
+    tables with a single list of flat objects, where building those dicts
+    is cheaper, go through the per-record loop instead.
+    """
+    if isinstance(data, dict):
+        data = [data]
+    if isinstance(data, list):
+        df = _flatten_records(data)
+        if df is not None:
+            return df
+    return _flatten_frame(pd.DataFrame(data)).reset_index(drop=True)
+
+def parse_table(table_json: str) -> pd.DataFrame:
+    """json.loads + flatten_table"""
+    return flatten_table(json.loads(table_json))
+
+def table_text(df: pd.DataFrame) -> str:
+    """
+    The text embedded for retrieval, serialised like the stored examples
+    (json.dumps of the records) so queries and documents share one format
+    """
+    return json.dumps(df.to_dict("records"), default=str)
+
+# ------------------------------------------------------------------------------
+# Microbenchmark against the loop previously used in rag_and_plot
+# ------------------------------------------------------------------------------
+def _legacy_flatten(data) -> pd.DataFrame:
+    if isinstance(data, list) and data and any(isinstance(v, list) for d in data for v in d.values()):
+        flat = []
+        for d in data:
+            base = {k:v for k,v in d.items() if not isinstance(v, list)}
+            nested = next(v for v in d.values() if isinstance(v, list))
+            for sub in nested:
+                flat.append({**base, **sub})
+        data = flat
+    return pd.DataFrame(data)
+
+def _synthetic_table(n_records: int, n_nested: int):
+    return [
+        {
+            "product": f"P{i}",
+            "region": f"R{i % 7}",
+            "sales": [{"month": m, "units": (i * m) % 97} for m in range(n_nested)],
+        }
+        for i in range(n_records)
+    ]
+
+if __name__ == "__main__":
+    # the first two sizes are typical of an LLM-generated table
+    for n_records, n_nested in [(3, 4), (10, 12), (100, 12), (1_000, 12), (5_000, 12), (2_000, 50)]:
+        data = _synthetic_table(n_records, n_nested)
+        timings = {}
+        for name, fn in [("legacy loop", _legacy_flatten), ("flatten_table", flatten_table),
+                         ("columnar path", lambda d: _flatten_frame(pd.DataFrame(d)).reset_index(drop=True))]:
+            best = float("inf")
+            for _ in range(3):
+                t0 = time.perf_counter()
+                df = fn(data)
+                best = min(best, time.perf_counter() - t0)
+            timings[name] = best
+        print(f"{n_records:>6} records x {n_nested:>3} nested = {len(df):>7} rows | "
+              + " | ".join(f"{k}: {v * 1000:8.1f} ms" for k, v in timings.items()))
@@ -0,0 +1,83 @@
+import json
+import time
+import hashlib
+from embed_cache import embed
+
+EMBED_MODEL = "nomic-embed-text"
+
+# ------------------------------------------------------------------------------
+# Shared, batched ingestion of example tables into a Chroma collection
+# ------------------------------------------------------------------------------
+def content_hash(document: str, metadata: dict) -> str:
+    """sha256 over the stored document and its metadata"""
+    payload = json.dumps([document, metadata], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def document_id(document: str, metadata: dict) -> str:
+    """
+    Stable ID derived from the document and its metadata, so re-runs never
+    duplicate rows and the same table labelled differently stays two rows
+    """
+    return "ex_" + content_hash(document, metadata)
+
+def ingest_documents(collection, documents, metadatas, batch_size: int = 64, model: str = EMBED_MODEL,
+                     prune: bool = False) -> int:
+    """
+    Embeds `documents` in batches of `batch_size` and upserts them together
+    with `metadatas` into `collection`.
+
+    Rows whose content hash is already stored are skipped without an
+    embedding call, so re-ingesting an unchanged dataset costs one
+    `collection.get` per batch. With `prune`, stored rows that are not part
+    of `documents` are deleted, so the collection mirrors the dataset.
+    Returns the number of rows written.
+    """
+    t0 = time.time()
+    # exact duplicates (same document and metadata) are stored once
+    rows = {}
+    for doc, meta in zip(documents, metadatas):
+        rows[document_id(doc, meta)] = (doc, meta)
+    ids = list(rows)
+
+    written = 0
+    for start in range(0, len(ids), batch_size):
+        batch_ids = ids[start:start + batch_size]
+        stored = collection.get(ids=batch_ids, include=["metadatas"])
+        stored_hashes = {
+            i: (m or {}).get("content_hash")
+            for i, m in zip(stored["ids"], stored["metadatas"])
+        }
+
+        todo_ids, todo_docs, todo_metas = [], [], []
+        for i in batch_ids:
+            doc, meta = rows[i]
+            h = content_hash(doc, meta)
+            if stored_hashes.get(i) == h:
+                continue
+            todo_ids.append(i)
+            todo_docs.append(doc)
+            todo_metas.append({**meta, "content_hash": h})
+
+        if not todo_ids:
+            continue
+
+        embs = embed(model, todo_docs)
+        collection.upsert(
+            ids=todo_ids,
+            documents=todo_docs,
+            embeddings=embs,
+            metadatas=todo_metas
+        )
+        written += len(todo_ids)
+
+    removed = 0
+    if prune:
+        stale = [i for i in collection.get(include=[])["ids"] if i not in rows]
+        for start in range(0, len(stale), batch_size):
+            collection.delete(ids=stale[start:start + batch_size])
+        removed = len(stale)
+
+    elapsed = max(time.time() - t0, 1e-9)
+    print(f"Ingested {len(ids)} rows ({written} embedded, {len(ids) - written} unchanged, "
+          f"{removed} removed) in {elapsed:.2f}s ({len(ids) / elapsed:.1f} rows/s)")
+    return written
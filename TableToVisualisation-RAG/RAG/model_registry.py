@@ -0,0 +1,86 @@
+import sys
+import time
+import threading
+import importlib
+
+# ------------------------------------------------------------------------------
+# Process-wide registry of lazily loaded models and store handles
+# ------------------------------------------------------------------------------
+# Nothing heavy is imported here: sentence_transformers, chromadb and friends
+# are only imported by the loader that first needs them, so importing a script
+# that uses the registry costs no more than its own light imports.
+_objects = {}
+_key_locks = {}
+_lock = threading.Lock()
+load_times = {}   # key -> seconds spent in its loader
+
+def _key_lock(key) -> threading.Lock:
+    with _lock:
+        return _key_locks.setdefault(key, threading.Lock())
+
+def get_or_load(key, loader):
+    """
+    Returns the object registered under `key`, calling `loader()` to create
+    it on first use. Concurrent first calls for the same key load it once;
+    loads of different keys do not wait for each other.
+    """
+    try:
+        return _objects[key]
+    except KeyError:
+        pass
+    with _key_lock(key):
+        if key not in _objects:
+            t0 = time.perf_counter()
+            _objects[key] = loader()
+            load_times[key] = time.perf_counter() - t0
+            print(f"Loaded {key} in {load_times[key]:.2f}s")
+        return _objects[key]
+
+def register(key, obj):
+    """Replaces the object under `key`, e.g. after a store was rebuilt"""
+    with _key_lock(key):
+        _objects[key] = obj
+    return obj
+
+def is_loaded(key) -> bool:
+    return key in _objects
+
+def get_sentence_encoder(name: str):
+    """Shared SentenceTransformer for `name`, loaded on first use"""
+    def load():
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(name)
+    return get_or_load(("sentence_encoder", name), load)
+
+def get_chroma_collection(name: str):
+    """Shared handle on the persisted Chroma collection `name`, opened on first use"""
+    def load():
+        from vector_store import get_collection
+        return get_collection(name)
+    return get_or_load(("chroma", name), load)
+
+# ------------------------------------------------------------------------------
+# Start-up profile: python model_registry.py [module ...]
+# ------------------------------------------------------------------------------
+def profile_import(module_name: str) -> float:
+    t0 = time.perf_counter()
+    importlib.import_module(module_name)
+    return time.perf_counter() - t0
+
+if __name__ == "__main__":
+    modules = sys.argv[1:] or ["excel", "exce", "rag_viz", "rag_viz_pipeline", "test"]
+    for module_name in modules:
+        try:
+            print(f"import {module_name:<18} {profile_import(module_name) * 1000:8.1f} ms")
+        except Exception as e:
+            print(f"import {module_name:<18} failed: {e}")
+
+    # first query pays for the encoder and index loads, the second one does not
+    if "excel" in sys.modules:
+        excel = sys.modules["excel"]
+        for label in ("first query", "second query"):
+            t0 = time.perf_counter()
+            excel.retrieve_relevant_description("State-wise total number of sales")
+            print(f"{label:<25} {(time.perf_counter() - t0) * 1000:8.1f} ms")
+    for key, seconds in load_times.items():
+        print(f"  loaded {key}: {seconds:.2f}s")
@@ -0,0 +1,41 @@
+import os
+import json
+import hashlib
+
+# ------------------------------------------------------------------------------
+# Content hashes and crash-safe writes shared by the on-disk caches
+# ------------------------------------------------------------------------------
+def file_hash(path: str) -> str:
+    """sha256 of a file's bytes"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def source_key(path: str) -> str:
+    """File-name-safe key for a source file: its stem and a hash of its absolute path"""
+    source = os.path.abspath(path)
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return f"{stem}-{hashlib.sha256(source.encode('utf-8')).hexdigest()[:16]}"
+
+def replace_atomically(path: str, write):
+    """Calls `write(tmp_path)` and moves the result over `path` atomically"""
+    tmp = path + ".tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+def read_json(path: str):
+    """Contents of a JSON manifest, or None if it is missing or unreadable"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_json(path: str, data: dict):
+    """Writes a JSON manifest atomically"""
+    def write(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+    replace_atomically(path, write)
@@ -1,51 +1,51 @@
 import sys
 import json
 import ollama
-from chromadb import Client
+from ingest import ingest_documents
+from embed_cache import embed
+from flatten import parse_table, table_text
+from vector_store import ensure_collection, file_hash, query_many
+from model_registry import get_chroma_collection, register
+from batch import run_batch, slot, CHAT_CONCURRENCY, EMBED_CONCURRENCY
+from chart_heuristics import classify_table, record_tier, CONFIDENCE_THRESHOLD
 import pandas as pd
-import matplotlib.pyplot as plt
-
-# ensure UTF‑8 stdout on Windows
-sys.stdout.reconfigure(encoding="utf-8")
+from chart_render import render_chart, show_chart
 
 # ------------------------------------------------------------------------------
 # 1. Initialize ChromaDB and ingest YOUR dataset examples as retrieval docs
 # ------------------------------------------------------------------------------
-chroma = Client()
-try:
-    collection = chroma.create_collection(name="viz_examples")
-except Exception:
-    collection = chroma.get_collection(name="viz_examples")
+# opened on first use, so importing this module does not touch the store
+def get_examples_collection():
+    return get_chroma_collection("viz_examples")
 
-def ingest_dataset(csv_path: str):
+def ingest_dataset(csv_path: str, batch_size: int = 64):
     """
     Assumes your CSV has columns: 
       - any number of feature cols (e.g. 'product', 'month') 
       - a numeric col (e.g. 'units') 
       - and a 'chart_type' column with values 'bar' or 'line'
     """
-    df = pd.read_csv(csv_path)
-    for i, row in df.iterrows():
-        # build minimal JSON record for this example
-        # flatten: combine all non-chart_type cols into one dict
-        rec = {k: row[k] for k in df.columns if k != "chart_type"}
-        table_json = json.dumps([rec])
-        # get embedding vector
-        emb = ollama.embed(model="nomic-embed-text", input=table_json).embeddings[0]
-        # store JSON + embedding + metadata
-        collection.add(
-            ids=[f"ex_{i}"],
-            documents=[table_json],
-            embeddings=[emb],
-            metadatas=[{
+    def build(coll):
+        df = pd.read_csv(csv_path)
+        documents, metadatas = [], []
+        for row in df.to_dict("records"):
+            # build minimal JSON record for this example
+            # flatten: combine all non-chart_type cols into one dict
+            rec = {k: v for k, v in row.items() if k != "chart_type"}
+            documents.append(json.dumps([rec]))
+            metadatas.append({
                 "chart_type": row["chart_type"],
                 # pick the first non-chart_type col as x, the numeric as y
                 "x_column": [c for c in rec if not isinstance(rec[c], (int,float))][0],
                 "y_column": [c for c in rec if isinstance(rec[c], (int,float))][0]
-            }]
-        )
+            })
+        # embed in batches and skip rows that are already stored
+        ingest_documents(coll, documents, metadatas, batch_size=batch_size, prune=True)
+
+    # only re-embeds when the CSV or the embedding model changed since last run
+    register(("chroma", "viz_examples"), ensure_collection("viz_examples", file_hash(csv_path), build))
 
-# call once at startup (or comment out after first run)
+# call at startup; it is a no-op while the CSV is unchanged
 # ingest_dataset("my_dataset.csv")
 
 # ------------------------------------------------------------------------------
@@ -59,10 +59,11 @@ Output **only** valid JSON—no backticks or commentary.
 TEXT:
 {user_prompt}
 """
-    resp = ollama.chat(
-        model="llama3.1",
-        messages=[{"role":"user","content":conv}]
-    )["message"]["content"].strip()
+    with slot("chat"):
+        resp = ollama.chat(
+            model="llama3.1",
+            messages=[{"role":"user","content":conv}]
+        )["message"]["content"].strip()
     # strip triple‑backtick fences if present
     if resp.startswith("```"):
         resp = resp.strip("`").strip()
@@ -71,96 +72,105 @@ TEXT:
 # ------------------------------------------------------------------------------
 # 3. RAG‑style lookup on YOUR examples + plotting
 # ------------------------------------------------------------------------------
-def rag_and_plot(table_json: str):
-    # parse & flatten nested structures if needed
-    data = json.loads(table_json)
-    # detect nested lists and flatten them
-    if isinstance(data, list) and data and any(isinstance(v, list) for d in data for v in d.values()):
-        flat = []
-        for d in data:
-            base = {k:v for k,v in d.items() if not isinstance(v, list)}
-            nested = next(v for v in d.values() if isinstance(v, list))
-            for sub in nested:
-                flat.append({**base, **sub})
-        data = flat
-
-    # embed the table for retrieval
-    qemb = ollama.embed(model="nomic-embed-text", input=json.dumps(data)).embeddings[0]
-    res = collection.query(
-        query_embeddings=[qemb],
-        n_results=1,
-        include=["metadatas"]
-    )
-    meta = res["metadatas"][0][0]
-    chart_type = meta["chart_type"]
-    x_col = meta["x_column"]
-    y_col = meta["y_column"]
-
-    # plot
-    df = pd.DataFrame(data)
-    plt.figure(figsize=(8,5))
-    if chart_type == "line":
-        plt.plot(df[x_col], df[y_col], marker="o")
+def retrieve_examples(tables, k: int = 1):
+    """
+    Top-k stored examples for each flattened table as
+    {"id", "distance", "metadata", "document"} dicts, nearest first.
+    All tables are embedded in one call and queried in batches.
+    """
+    texts = [table_text(df) for df in tables]
+    return query_many(get_examples_collection(), embed("nomic-embed-text", texts), n_results=k)
+
+def rag_and_plot(table_json: str, fmt: str = None):
+    # parse & flatten nested structures (any depth, any number of lists) into columns
+    df = parse_table(table_json)
+
+    # cheap feature classifier first; only embed and retrieve when it is unsure
+    chart_type, x_col, y_col, confidence = classify_table(df)
+    if confidence >= CONFIDENCE_THRESHOLD:
+        record_tier("heuristic")
     else:
-        plt.bar(df[x_col], df[y_col])
-    plt.xlabel(x_col)
-    plt.ylabel(y_col)
-    plt.title(f"{chart_type.title()} of {y_col} vs {x_col}")
-    plt.tight_layout()
-    plt.show()
+        record_tier("retrieval")
+        # embed the table for retrieval
+        meta = retrieve_examples([df])[0][0]["metadata"]
+        chart_type = meta["chart_type"]
+        x_col = meta["x_column"]
+        y_col = meta["y_column"]
+
+    # plot: headless image bytes when a format is requested, else a window
+    if fmt:
+        return render_chart(df, chart_type, x_col, y_col, fmt=fmt)
+    show_chart(df, chart_type, x_col, y_col)
 
 # ------------------------------------------------------------------------------
 # 4. Full pipeline
 # ------------------------------------------------------------------------------
-def pipeline(user_prompt: str):
+def pipeline(user_prompt: str, fmt: str = None):
     table_json = text_to_json_table(user_prompt)
     print("Generated JSON table:")
     print(table_json)
-    rag_and_plot(table_json)
+    return rag_and_plot(table_json, fmt=fmt)
+
+def pipeline_batch(user_prompts, fmt: str = "png", chat_concurrency: int = CHAT_CONCURRENCY,
+                   embed_concurrency: int = EMBED_CONCURRENCY) -> list:
+    """
+    Runs many prompts through the pipeline concurrently, with at most
+    `chat_concurrency` LLM and `embed_concurrency` embedding requests in
+    flight. Returns one {"index", "input", "ok", "result", "error", "seconds"}
+    record per prompt in input order; "result" holds the chart bytes.
+    """
+    return run_batch(
+        user_prompts,
+        lambda prompt: rag_and_plot(text_to_json_table(prompt), fmt=fmt),
+        chat_concurrency=chat_concurrency,
+        embed_concurrency=embed_concurrency,
+    )
 
 # ------------------------------------------------------------------------------
 # 5. Example run
 # ------------------------------------------------------------------------------
 if __name__ == "__main__":
+    # ensure UTF‑8 stdout on Windows
+    sys.stdout.reconfigure(encoding="utf-8")
     user_input = input("Enter your data description:\n> ")
     pipeline(user_input)
 import sys
 import json
 import ollama
-from chromadb import Client
+from ingest import ingest_documents
+from embed_cache import embed
+from flatten import parse_table, table_text
+from vector_store import ensure_collection, file_hash, query_many
+from model_registry import get_chroma_collection, register
+from batch import run_batch, slot, CHAT_CONCURRENCY, EMBED_CONCURRENCY
+from chart_heuristics import classify_table, record_tier, CONFIDENCE_THRESHOLD
 import pandas as pd
-import matplotlib.pyplot as plt
-
-# ensure UTF‑8 stdout on Windows
-sys.stdout.reconfigure(encoding="utf-8")
+from chart_render import render_chart, show_chart
 
 # ------------------------------------------------------------------------------
 # 1. Initialize ChromaDB and ingest YOUR dataset examples as retrieval docs
 # ------------------------------------------------------------------------------
-chroma = Client()
-try:
-    collection = chroma.create_collection(name="viz_examples")
-except Exception:
-    collection = chroma.get_collection(name="viz_examples")
-
-def ingest_dataset(csv_path: str):
-    df = pd.read_csv(csv_path)
-    for i, row in df.iterrows():
-        rec = {k: row[k] for k in df.columns if k != "chart_type"}
-        table_json = json.dumps([rec])
-        emb = ollama.embed(model="nomic-embed-text", input=table_json).embeddings[0]
-        collection.add(
-            ids=[f"ex_{i}"],
-            documents=[table_json],
-            embeddings=[emb],
-            metadatas=[{
+# opened on first use, so importing this module does not touch the store
+def get_examples_collection():
+    return get_chroma_collection("viz_examples")
+
+def ingest_dataset(csv_path: str, batch_size: int = 64):
+    def build(coll):
+        df = pd.read_csv(csv_path)
+        documents, metadatas = [], []
+        for row in df.to_dict("records"):
+            rec = {k: v for k, v in row.items() if k != "chart_type"}
+            documents.append(json.dumps([rec]))
+            metadatas.append({
                 "chart_type": row["chart_type"],
                 "x_column": next(c for c,v in rec.items() if not isinstance(v, (int,float))),
                 "y_column": next(c for c,v in rec.items() if isinstance(v, (int,float)))
-            }]
-        )
+            })
+        ingest_documents(coll, documents, metadatas, batch_size=batch_size, prune=True)
+
+    register(("chroma", "viz_examples"), ensure_collection("viz_examples", file_hash(csv_path), build))
 
-# Uncomment and run once to load your CSV into ChromaDB:
+# Uncomment to load your CSV into the on-disk ChromaDB (rebuilt only when it changes):
 # ingest_dataset("my_dataset.csv")
 
 # ------------------------------------------------------------------------------
@@ -174,10 +184,11 @@ Output **only** valid JSON—no backticks or commentary.
 TEXT:
 {user_prompt}
 """
-    resp = ollama.chat(
-        model="llama3.1",
-        messages=[{"role":"user","content":conv}]
-    )["message"]["content"].strip()
+    with slot("chat"):
+        resp = ollama.chat(
+            model="llama3.1",
+            messages=[{"role":"user","content":conv}]
+        )["message"]["content"].strip()
     if resp.startswith("```"):
         resp = resp.strip("`").strip()
     return resp
@@ -185,47 +196,60 @@ TEXT:
 # ------------------------------------------------------------------------------
 # 3. RAG‑style lookup on YOUR examples + plotting
 # ------------------------------------------------------------------------------
-def rag_and_plot(table_json: str):
-    data = json.loads(table_json)
+def retrieve_examples(tables, k: int = 1):
+    """
+    Top-k stored examples for each flattened table as
+    {"id", "distance", "metadata", "document"} dicts, nearest first.
+    All tables are embedded in one call and queried in batches.
+    """
+    texts = [table_text(df) for df in tables]
+    return query_many(get_examples_collection(), embed("nomic-embed-text", texts), n_results=k)
+
+def rag_and_plot(table_json: str, fmt: str = None):
     # flatten nested lists if present
-    if any(isinstance(v, list) for d in data for v in d.values()):
-        flat=[]
-        for d in data:
-            base={k:v for k,v in d.items() if not isinstance(v, list)}
-            nested=next(v for v in d.values() if isinstance(v, list))
-            for sub in nested:
-                flat.append({**base, **sub})
-        data=flat
-
-    qemb = ollama.embed(model="nomic-embed-text", input=json.dumps(data)).embeddings[0]
-    res = collection.query(query_embeddings=[qemb], n_results=1, include=["metadatas"])
-    meta = res["metadatas"][0][0]
-    chart_type, x_col, y_col = meta["chart_type"], meta["x_column"], meta["y_column"]
-
-    df = pd.DataFrame(data)
-    plt.figure(figsize=(8,5))
-    if chart_type=="line":
-        plt.plot(df[x_col], df[y_col], marker="o")
+    df = parse_table(table_json)
+
+    chart_type, x_col, y_col, confidence = classify_table(df)
+    if confidence >= CONFIDENCE_THRESHOLD:
+        record_tier("heuristic")
     else:
-        plt.bar(df[x_col], df[y_col])
-    plt.xlabel(x_col)
-    plt.ylabel(y_col)
-    plt.title(f"{chart_type.title()} of {y_col} vs {x_col}")
-    plt.tight_layout()
-    plt.show()
+        record_tier("retrieval")
+        meta = retrieve_examples([df])[0][0]["metadata"]
+        chart_type, x_col, y_col = meta["chart_type"], meta["x_column"], meta["y_column"]
+
+    if fmt:
+        return render_chart(df, chart_type, x_col, y_col, fmt=fmt)
+    show_chart(df, chart_type, x_col, y_col)
 
 # ------------------------------------------------------------------------------
 # 4. Full pipeline
 # ------------------------------------------------------------------------------
-def pipeline(user_prompt: str):
+def pipeline(user_prompt: str, fmt: str = None):
     table_json = text_to_json_table(user_prompt)
     print("\nGenerated JSON table:")
     print(table_json, "\n")
-    rag_and_plot(table_json)
+    return rag_and_plot(table_json, fmt=fmt)
+
+def pipeline_batch(user_prompts, fmt: str = "png", chat_concurrency: int = CHAT_CONCURRENCY,
+                   embed_concurrency: int = EMBED_CONCURRENCY) -> list:
+    """
+    Runs many prompts through the pipeline concurrently, with at most
+    `chat_concurrency` LLM and `embed_concurrency` embedding requests in
+    flight. Returns one {"index", "input", "ok", "result", "error", "seconds"}
+    record per prompt in input order; "result" holds the chart bytes.
+    """
+    return run_batch(
+        user_prompts,
+        lambda prompt: rag_and_plot(text_to_json_table(prompt), fmt=fmt),
+        chat_concurrency=chat_concurrency,
+        embed_concurrency=embed_concurrency,
+    )
 
 # ------------------------------------------------------------------------------
 # 5. Interactive entry point
 # ------------------------------------------------------------------------------
 if __name__ == "__main__":
+    # ensure UTF‑8 stdout on Windows
+    sys.stdout.reconfigure(encoding="utf-8")
     user_input = input("Enter your data description:\n> ")
     pipeline(user_input)
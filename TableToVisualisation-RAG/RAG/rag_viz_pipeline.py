@@ -1,28 +1,32 @@
 import json
 import ollama
-from chromadb import Client
+from ingest import ingest_documents
+from embed_cache import embed
+from flatten import parse_table
+from vector_store import ensure_collection, data_hash
+from model_registry import get_or_load
+from batch import run_batch, slot, CHAT_CONCURRENCY, EMBED_CONCURRENCY
+from chart_heuristics import classify_table, record_tier, CONFIDENCE_THRESHOLD
 import pandas as pd
-import matplotlib.pyplot as plt
+from chart_render import render_chart, show_chart
 
 # ------------------------------------------------------------------------------
 # 1. Init ChromaDB vector store & ingest visualization‐rules
 # ------------------------------------------------------------------------------
-chroma = Client()
-try:
-    collection = chroma.create_collection(name="viz_guidelines")
-except Exception:
-    collection = chroma.get_collection(name="viz_guidelines")
-
 guidelines = [
     "If the table’s first column is a date or time series, use a line chart.",
     "If the table has discrete categories with numeric values, use a bar chart.",
     "If there are more than 10 categories, consider grouping or using a bar chart."
 ]
 
-for idx, rule in enumerate(guidelines):
-    resp = ollama.embed(model="nomic-embed-text", input=rule)
-    emb = resp.embeddings[0]
-    collection.add(ids=[f"rule_{idx}"], documents=[rule], embeddings=[emb])
+# opened on first use and embedded only when the guideline list (or embedding
+# model) changes, so importing this module does not touch the store
+def get_guidelines_collection():
+    return get_or_load(("chroma", "viz_guidelines"), lambda: ensure_collection(
+        "viz_guidelines",
+        data_hash(guidelines),
+        lambda coll: ingest_documents(coll, guidelines, [{"kind": "guideline"} for _ in guidelines], prune=True)
+    ))
 
 # ------------------------------------------------------------------------------
 # 2. Convert user prompt → JSON table
@@ -38,21 +42,25 @@ Output **only** valid JSON—no commentary.
 TEXT:
 {user_prompt}
 """
-    chat = ollama.chat(
-        model="llama3.1",
-        messages=[{"role":"user","content":conv_prompt}]
-    )
+    with slot("chat"):
+        chat = ollama.chat(
+            model="llama3.1",
+            messages=[{"role":"user","content":conv_prompt}]
+        )
     return chat["message"]["content"].strip()
 
 # ------------------------------------------------------------------------------
 # 3. RAG + chart‐creation
 # ------------------------------------------------------------------------------
-def rag_and_plot(table_json: str):
+def llm_decision(table_json: str) -> dict:
+    """
+    Retrieves the closest guideline and asks the LLM for
+    {"chart_type", "x_column", "y_column"}.
+    """
     # a) Retrieve best guideline
     query = f"Which chart type for this data? {table_json}"
-    qresp = ollama.embed(model="nomic-embed-text", input=query)
-    qvec  = qresp.embeddings[0]
-    res   = collection.query(query_embeddings=[qvec], n_results=1)
+    qvec  = embed("nomic-embed-text", query)[0]
+    res   = get_guidelines_collection().query(query_embeddings=[qvec], n_results=1)
     guideline = res["documents"][0][0]
 
     # b) Ask LLM for chart decision
@@ -70,36 +78,56 @@ Reply **ONLY** with JSON:
   "y_column": "name_of_column"
 }}
 """
-    chat    = ollama.chat(
-        model="llama3.1",
-        messages=[{"role":"user","content":decision_prompt}]
-    )
-    decision = json.loads(chat["message"]["content"])
+    with slot("chat"):
+        chat = ollama.chat(
+            model="llama3.1",
+            messages=[{"role":"user","content":decision_prompt}]
+        )
+    return json.loads(chat["message"]["content"])
+
+def rag_and_plot(table_json: str, fmt: str = None):
+    df = parse_table(table_json)
 
-    # c) Plot it
-    df = pd.DataFrame(json.loads(table_json))
-    plt.figure(figsize=(8,5))
-    if decision["chart_type"] == "line":
-        plt.plot(df[decision["x_column"]], df[decision["y_column"]], marker="o")
+    # a) Cheap feature classifier first; retrieval and the LLM only run when it is unsure
+    chart_type, x_col, y_col, confidence = classify_table(df)
+    if confidence >= CONFIDENCE_THRESHOLD:
+        record_tier("heuristic")
+        decision = {"chart_type": chart_type, "x_column": x_col, "y_column": y_col}
     else:
-        plt.bar(df[decision["x_column"]], df[decision["y_column"]])
-    plt.xlabel(decision["x_column"])
-    plt.ylabel(decision["y_column"])
-    plt.title(f"{decision['chart_type'].title()} of {decision['y_column']} vs {decision['x_column']}")
-    plt.tight_layout()
-    plt.show()
+        record_tier("llm")
+        decision = llm_decision(table_json)
+
+    # b) Plot it
+    if fmt:
+        return render_chart(df, decision["chart_type"], decision["x_column"], decision["y_column"], fmt=fmt)
+    show_chart(df, decision["chart_type"], decision["x_column"], decision["y_column"])
 
 # ------------------------------------------------------------------------------
 # 4. End‑to‑end pipeline
 # ------------------------------------------------------------------------------
-def pipeline(user_prompt: str):
+def pipeline(user_prompt: str, fmt: str = None):
     # 1) Text → JSON table
     table_json = text_to_json_table(user_prompt)
     print(" Generated JSON table:")
     print(table_json)
 
-    # 2) RAG + plot
-    rag_and_plot(table_json)
+    # 2) RAG + plot (image bytes when a format is requested)
+    return rag_and_plot(table_json, fmt=fmt)
+
+def pipeline_batch(user_prompts, fmt: str = "png", chat_concurrency: int = CHAT_CONCURRENCY,
+                   embed_concurrency: int = EMBED_CONCURRENCY) -> list:
+    """
+    Runs many prompts through the pipeline concurrently, with at most
+    `chat_concurrency` LLM and `embed_concurrency` embedding requests in
+    flight. Returns one {"index", "input", "ok", "result", "error", "seconds"}
+    record per prompt in input order; "result" holds the chart bytes.
+    """
+    return run_batch(
+        user_prompts,
+        lambda prompt: rag_and_plot(text_to_json_table(prompt), fmt=fmt),
+        chat_concurrency=chat_concurrency,
+        embed_concurrency=embed_concurrency,
+    )
 
 # ------------------------------------------------------------------------------
 # 5. Example usage
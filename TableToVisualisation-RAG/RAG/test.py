@@ -1,62 +1,53 @@
 import sys
 import json
 import ollama
-from chromadb import Client
+from ingest import ingest_documents
+from embed_cache import embed
+from vector_store import ensure_collection, file_hash, query_many
+from model_registry import get_chroma_collection, register
+from dataset_cache import load_sheet
+from chart_heuristics import classify_table, record_tier, CONFIDENCE_THRESHOLD
 import pandas as pd
-import matplotlib.pyplot as plt
-
-# ---- ensure UTF‑8 stdout on Windows ----
-sys.stdout.reconfigure(encoding="utf-8")
+from chart_render import render_chart, show_chart
 
 # ---- 1. Init ChromaDB collection for chart‐type examples ----
-chroma = Client()
-try:
-    collection = chroma.create_collection(name="chart_type_examples")
-except:
-    collection = chroma.get_collection(name="chart_type_examples")
+# opened on first use, so importing this module does not touch the store
+def get_examples_collection():
+    return get_chroma_collection("chart_type_examples")
 
 # ---- 2. Ingest only chart‐type metadata from your Dataset.xlsx ----
-def ingest_dataset(excel_path: str):
+def ingest_dataset(excel_path: str, batch_size: int = 64):
     """
     Reads Dataset.xlsx with columns:
       - 'Table' (JSON array string)
       - 'Visualisation Type' ('Bar' or 'Line')
     and stores each row’s JSON + chart_type metadata.
+    Rows already stored with the same content are skipped, and the Excel
+    file is not even read while the on-disk store matches its hash.
     """
-    df = pd.read_excel(excel_path)
-    for idx, row in df.iterrows():
-        table_json = row["Table"].strip()
-        emb = ollama.embed(
-            model="nomic-embed-text",
-            input=table_json
-        ).embeddings[0]
-        collection.add(
-            ids=[f"ex_{idx}"],
-            documents=[table_json],
-            embeddings=[emb],
-            metadatas=[{"chart_type": row["Visualisation Type"].lower()}]
-        )
+    def build(coll):
+        df = load_sheet(excel_path, columns=["Table", "Visualisation Type"])
+        documents = df["Table"].str.strip().tolist()
+        metadatas = [{"chart_type": t.lower()} for t in df["Visualisation Type"]]
+        ingest_documents(coll, documents, metadatas, batch_size=batch_size, prune=True)
 
-# Run once to populate ChromaDB, then comment out on future runs:
-ingest_dataset("C:/Users/Prachi/OneDrive/Documents/mini project ty/Text-to-VR-Visualizing-Numerical-Data/rag/rag_training_data.xlsx")
+    register(("chroma", "chart_type_examples"), ensure_collection("chart_type_examples", file_hash(excel_path), build))
 
 
 # ---- 3. Given JSON → retrieve chart_type via RAG, then ask LLM for axes, then plot ----
-def rag_and_plot(table_json: str):
-    # parse
-    data = json.loads(table_json)
+def retrieve_chart_types(tables_json, k: int = 1):
+    """
+    Top-k neighbouring examples for each JSON table as
+    {"id", "distance", "metadata", "document"} dicts, nearest first.
+    All tables are embedded in one call and queried in batches.
+    """
+    texts = [json.dumps(json.loads(t)) for t in tables_json]
+    return query_many(get_examples_collection(), embed("nomic-embed-text", texts), n_results=k)
 
+def model_decision(table_json: str):
+    """(chart_type, x_column, y_column) from retrieval plus the axes LLM call"""
     # 3a) embed & retrieve nearest example’s chart_type
-    qemb = ollama.embed(
-        model="nomic-embed-text",
-        input=json.dumps(data)
-    ).embeddings[0]
-    res = collection.query(
-        query_embeddings=[qemb],
-        n_results=1,
-        include=["metadatas"]
-    )
-    chart_type = res["metadatas"][0][0]["chart_type"]
+    chart_type = retrieve_chart_types([table_json])[0][0]["metadata"]["chart_type"]
 
     # 3b) ask LLM to choose axes
     axes_prompt = f"""
@@ -75,20 +66,25 @@ Reply ONLY with JSON:
         messages=[{"role": "user", "content": axes_prompt}]
     )
     axes = json.loads(chat["message"]["content"].strip())
+    return chart_type, axes["x_column"], axes["y_column"]
 
-    # 3c) render with matplotlib
+def rag_and_plot(table_json: str, fmt: str = None):
+    # parse
+    data = json.loads(table_json)
     df = pd.DataFrame(data)
-    plt.figure(figsize=(8,5))
-    x, y = axes["x_column"], axes["y_column"]
-    if chart_type == "line":
-        plt.plot(df[x], df[y], marker="o")
+
+    # cheap feature classifier first; retrieval and the LLM only run when it is unsure
+    chart_type, x, y, confidence = classify_table(df)
+    if confidence >= CONFIDENCE_THRESHOLD:
+        record_tier("heuristic")
     else:
-        plt.bar(df[x], df[y])
-    plt.xlabel(x)
-    plt.ylabel(y)
-    plt.title(f"{chart_type.title()} of {y} vs {x}")
-    plt.tight_layout()
-    plt.show()
+        record_tier("retrieval+llm")
+        chart_type, x, y = model_decision(table_json)
+
+    # 3c) render with matplotlib (headless bytes if fmt is given)
+    if fmt:
+        return render_chart(df, chart_type, x, y, fmt=fmt)
+    show_chart(df, chart_type, x, y)
 
 # ---- 4. Interactive entry point taking raw JSON from user ----
 def pipeline_json():
@@ -105,4 +101,8 @@ def pipeline_json():
     rag_and_plot(table_json)
 
 if __name__ == "__main__":
+    # ---- ensure UTF‑8 stdout on Windows ----
+    sys.stdout.reconfigure(encoding="utf-8")
+    # Populates the on-disk ChromaDB; later runs reuse it until the file changes:
+    ingest_dataset("C:/Users/Prachi/OneDrive/Documents/mini project ty/Text-to-VR-Visualizing-Numerical-Data/rag/rag_training_data.xlsx")
     pipeline_json()
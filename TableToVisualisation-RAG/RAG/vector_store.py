@@ -0,0 +1,106 @@
+import os
+import json
+import hashlib
+from ingest import EMBED_MODEL
+from persist import file_hash, read_json, write_json
+
+# ------------------------------------------------------------------------------
+# On-disk Chroma collections, versioned by a manifest next to the store
+# ------------------------------------------------------------------------------
+STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chroma_store")
+
+_client = None
+
+def get_client():
+    """Single persistent Chroma client per process, created on first use"""
+    global _client
+    if _client is None:
+        import chromadb
+        _client = chromadb.PersistentClient(path=STORE_DIR)
+    return _client
+
+def data_hash(items) -> str:
+    """sha256 of any JSON-serialisable in-code dataset"""
+    return hashlib.sha256(json.dumps(items, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _manifest_path(name: str) -> str:
+    return os.path.join(STORE_DIR, f"{name}.manifest.json")
+
+def read_manifest(name: str):
+    return read_json(_manifest_path(name))
+
+def get_collection(name: str):
+    """Open (or create empty) a persisted collection without any versioning"""
+    return get_client().get_or_create_collection(name=name)
+
+def ensure_collection(name: str, dataset_hash: str, build, embed_model: str = EMBED_MODEL):
+    """
+    Returns the persisted collection `name`, calling `build(collection)` to
+    (re)populate it only when its manifest is missing or stale.
+
+    The manifest records the embedding model, the dataset hash and the row
+    count. When only the dataset changed, `build` runs on the existing
+    collection and is expected to upsert the dataset with
+    `ingest_documents(..., prune=True)`, which re-embeds only the changed
+    rows and deletes the removed ones. A different embedding model, or a
+    missing manifest or collection, rebuilds it from scratch.
+    """
+    client = get_client()
+    manifest = read_manifest(name)
+    collection = None
+    if manifest and manifest.get("embedding_model") == embed_model:
+        try:
+            collection = client.get_collection(name=name)
+        except Exception:
+            collection = None
+
+    if collection is not None:
+        if manifest.get("dataset_hash") == dataset_hash and collection.count() == manifest.get("row_count"):
+            return collection
+        print(f"Updating vector store '{name}' (dataset changed)")
+    else:
+        print(f"Building vector store '{name}' (manifest missing or embedding model changed)")
+        try:
+            client.delete_collection(name=name)
+        except Exception:
+            pass
+        collection = client.create_collection(name=name)
+
+    build(collection)
+    write_json(_manifest_path(name), {
+        "collection": name,
+        "embedding_model": embed_model,
+        "dataset_hash": dataset_hash,
+        "row_count": collection.count(),
+    })
+    return collection
+
+def _column(res: dict, name: str, q: int, n: int) -> list:
+    """Per-query values of one collection.query result field, Nones if not included"""
+    values = res.get(name)
+    return values[q] if values and values[q] is not None else [None] * n
+
+def query_many(collection, embeddings, n_results: int = 1, include=("metadatas", "distances"), batch_size: int = 256):
+    """
+    Top-`n_results` neighbours for every embedding, as one list of
+    {"id", "distance", "metadata", "document"} dicts per query.
+
+    Embeddings are sent `batch_size` per collection.query call instead of
+    one call per query; fields not listed in `include` are None.
+    """
+    results = []
+    for start in range(0, len(embeddings), batch_size):
+        res = collection.query(
+            query_embeddings=list(embeddings[start:start + batch_size]),
+            n_results=n_results,
+            include=list(include),
+        )
+        for q, ids in enumerate(res["ids"]):
+            distances = _column(res, "distances", q, len(ids))
+            metadatas = _column(res, "metadatas", q, len(ids))
+            documents = _column(res, "documents", q, len(ids))
+            results.append([
+                {"id": i, "distance": d, "metadata": m, "document": doc}
+                for i, d, m, doc in zip(ids, distances, metadatas, documents)
+            ])
+    return results
@@ -0,0 +1,39 @@
+import types
+
+import pytest
+
+import embed_cache
+
+
+class FakeOllama:
+    def __init__(self):
+        self.calls = 0
+
+    def embed(self, model, input):
+        self.calls += 1
+        return types.SimpleNamespace(embeddings=[[len(t) / 3, 0.1] for t in input])
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = embed_cache.EmbeddingCache(path=str(tmp_path / "cache.sqlite3"), max_entries=10)
+    monkeypatch.setattr(embed_cache, "_cache", cache)
+    monkeypatch.setattr(embed_cache, "ollama", FakeOllama())
+    return cache
+
+
+def test_hit_returns_the_vector_of_the_miss(cache):
+    first = embed_cache.embed("m", ["a table", "a query"])
+    second = embed_cache.embed("m", ["a query", "a table"])
+    assert second == first[::-1]
+    assert embed_cache.ollama.calls == 1
+    assert cache.stats()["hits"] == 2
+
+
+def test_eviction_keeps_the_most_recent_entries(cache):
+    for i in range(25):
+        embed_cache.embed("m", f"text {i}")
+    (rows,) = cache._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+    assert rows <= cache.max_entries
+    assert cache.get_many("m", ["text 24"])[0] is not None
+    assert cache.get_many("m", ["text 0"])[0] is None
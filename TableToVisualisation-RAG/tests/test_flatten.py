@@ -0,0 +1,54 @@
+import pandas as pd
+import pytest
+
+from flatten import _flatten_frame, _legacy_flatten, _synthetic_table, flatten_table
+
+
+def columns(data):
+    return flatten_table(data).to_dict("records")
+
+
+def test_object_fields_are_prefixed():
+    data = [{"region": "N", "sales": {"units": 1, "usd": 10}, "returns": {"units": 2, "usd": 20}}]
+    assert columns(data) == [
+        {"region": "N", "sales.units": 1, "sales.usd": 10, "returns.units": 2, "returns.usd": 20}
+    ]
+
+
+def test_nested_objects_keep_the_full_path():
+    assert columns([{"a": {"b": {"c": 1}}, "d": 2}]) == [{"d": 2, "a.b.c": 1}]
+
+
+def test_list_fields_with_the_same_keys():
+    data = [{"region": "N", "sales": [{"units": 1}, {"units": 3}], "returns": [{"units": 2}]}]
+    assert columns(data) == [
+        {"region": "N", "units": 1, "returns.units": 2},
+        {"region": "N", "units": 3, "returns.units": 2},
+    ]
+
+
+def test_list_element_colliding_with_parent():
+    data = [{"month": "total", "units": 9, "sales": [{"month": "Jan", "units": 4}]}]
+    assert columns(data) == [{"month": "total", "units": 9, "sales.month": "Jan", "sales.units": 4}]
+
+
+def test_prefixed_name_already_taken():
+    with pytest.raises(ValueError):
+        flatten_table([{"sales.units": 1, "sales": {"units": 2}}])
+
+
+def test_single_list_matches_legacy_loop():
+    data = _synthetic_table(20, 5)
+    pd.testing.assert_frame_equal(flatten_table(data), _legacy_flatten(data))
+
+
+@pytest.mark.parametrize("n_records, n_nested", [(3, 4), (10, 12), (100, 12)])
+def test_small_table_path_matches_columnar_path(n_records, n_nested):
+    data = _synthetic_table(n_records, n_nested)
+    pd.testing.assert_frame_equal(
+        flatten_table(data), _flatten_frame(pd.DataFrame(data)).reset_index(drop=True)
+    )
+
+
+def test_empty_nested_list_drops_the_record():
+    assert columns([{"k": 1, "rows": []}, {"k": 2, "rows": [{"v": 3}]}]) == [{"k": 2, "v": 3}]
@@ -0,0 +1,97 @@
+'''
+Measures the per-token cost of streaming detokenization.
+
+Tokenizes a sample text, then replays its ids one token at a time through
+IncrementalDetokenizer and through a full re-decode of the reply at every
+step. It reports the mean cost per token in each quarter of the reply, so a
+flat row means constant per-token cost, and checks that the streamed deltas
+add up to the full decode.
+
+Example:
+python benchmark-detokenizer.py --tokenizer user_data/models/Qwen2.5-0.5B-Instruct --tokens 4096
+'''
+
+import argparse
+import time
+
+from transformers import AutoTokenizer
+
+from modules.detokenizer import IncrementalDetokenizer
+
+# Mixes plain words, SentencePiece word boundaries and characters that span
+# several byte tokens (accents, CJK, emoji)
+SAMPLE = (
+    "| Region | Revenue (€) | Growth |\n|---|---|---|\n"
+    "| Zürich | 1 204,50 | +3.2% |\n| 東京 | 987 654 | −1.1% 📉 |\n"
+    "| São Paulo | 45 000 | +12% 🚀 |\n"
+    "The quarterly figures above were extracted from the report; naïve totals "
+    "differ from the audited ones by less than 0.5 %. "
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tokenizer', type=str, required=True, help='Path or Hugging Face name of the tokenizer.')
+    parser.add_argument('--tokens', type=int, default=2048, help='Number of reply tokens to stream.')
+    parser.add_argument('--text', type=str, default=None, help='Text file to tokenize instead of the built-in sample.')
+    parser.add_argument('--skip-full', action='store_true', help='Skip the full re-decode baseline (slow for long replies).')
+    return parser.parse_args()
+
+
+def stream_incremental(tokenizer, prompt_ids, reply_ids):
+    detokenizer = IncrementalDetokenizer(tokenizer, prompt_ids)
+    timings, text = [], ''
+    for token in reply_ids:
+        t0 = time.perf_counter()
+        text += detokenizer.add([token])
+        timings.append(time.perf_counter() - t0)
+
+    return text, timings
+
+
+def stream_full(tokenizer, prompt_ids, reply_ids):
+    timings, text = [], ''
+    for i in range(1, len(reply_ids) + 1):
+        t0 = time.perf_counter()
+        decoded = tokenizer.decode(reply_ids[:i], skip_special_tokens=True)
+        if not decoded.endswith(chr(0xfffd)):
+            text = decoded
+
+        timings.append(time.perf_counter() - t0)
+
+    return text, timings
+
+
+def quarters(timings):
+    n = len(timings)
+    bounds = [n * q // 4 for q in range(5)]
+    return [1e6 * sum(timings[a:b]) / max(b - a, 1) for a, b in zip(bounds, bounds[1:])]
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+
+    text = open(args.text, encoding='utf-8').read() if args.text else SAMPLE
+    ids = tokenizer.encode(text, add_special_tokens=False)
+    while len(ids) < args.tokens + 16:
+        ids += ids
+
+    prompt_ids, reply_ids = ids[:16], ids[16:16 + args.tokens]
+    expected = tokenizer.decode(ids[:16 + args.tokens], skip_special_tokens=True)[len(tokenizer.decode(prompt_ids, skip_special_tokens=True)):]
+
+    results = {'incremental': stream_incremental(tokenizer, prompt_ids, reply_ids)}
+    if not args.skip_full:
+        results['full re-decode'] = stream_full(tokenizer, prompt_ids, reply_ids)
+
+    print(f"{len(reply_ids)} tokens, mean µs per token by quarter of the reply")
+    print(f"{'method':<16}{'Q1':>10}{'Q2':>10}{'Q3':>10}{'Q4':>10}{'total ms':>12}")
+    for name, (streamed, timings) in results.items():
+        row = ''.join(f'{x:>10.1f}' for x in quarters(timings))
+        print(f"{name:<16}{row}{1e3 * sum(timings):>12.1f}")
+
+    streamed = results['incremental'][0]
+    if streamed.strip() == expected.strip():
+        print('Incremental output matches the full decode.')
+    else:
+        print('Incremental output differs from the full decode!')
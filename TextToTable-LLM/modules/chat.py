@@ -5,6 +5,9 @@ import html
 import json
 import pprint
 import re
+import threading
+import weakref
+from collections import OrderedDict
 from datetime import datetime
 from functools import partial
 from pathlib import Path
@@ -59,6 +62,90 @@ def str_presenter(dumper, data):
 yaml.add_representer(str, str_presenter)
 yaml.representer.SafeRepresenter.add_representer(str, str_presenter)
 
+# Token counts of single rendered messages, used to plan prompt truncation.
+# Keyed by the tokenizer and everything that affects the rendering, so a
+# message is tokenized once no matter how many turns it stays in the history.
+message_lengths = OrderedDict()
+message_lengths_lock = threading.Lock()
+MESSAGE_LENGTHS_MAX = 4096
+
+
+def _tokenizer_ref(tokenizer):
+    try:
+        return weakref.ref(tokenizer)
+    except TypeError:
+        return lambda: tokenizer
+
+
+# The tokenizer the cached lengths were measured with. The cache is emptied
+# when another one is loaded, so a new tokenizer never reuses the id() of a
+# freed one that is still in the keys.
+message_lengths_tokenizer = _tokenizer_ref(None)
+
+
+def _cache_key(renderer_key, role, content):
+    global message_lengths_tokenizer
+
+    tokenizer = shared.tokenizer
+    if message_lengths_tokenizer() is not tokenizer:
+        message_lengths.clear()
+        message_lengths_tokenizer = _tokenizer_ref(tokenizer)
+
+    return (shared.args.loader, shared.model_name, id(tokenizer), renderer_key, role, content)
+
+
+def _cache_put(key, value):
+    message_lengths[key] = value
+    while len(message_lengths) > MESSAGE_LENGTHS_MAX:
+        message_lengths.popitem(last=False)
+
+
+def get_reference_length(renderer, renderer_key, role):
+    '''
+    The tokens of the template that are rendered regardless of the messages.
+    Templates may index messages[0], so this is derived from one and two
+    empty messages of the given role rather than from an empty list.
+    '''
+    with message_lengths_lock:
+        key = _cache_key(renderer_key, role, None)
+        reference = message_lengths.get(key)
+
+    if reference is None:
+        empty = {"role": role, "content": ""}
+        one = get_encoded_length(renderer(messages=[empty]))
+        two = get_encoded_length(renderer(messages=[empty, empty]))
+        reference = 2 * one - two
+        with message_lengths_lock:
+            _cache_put(key, reference)
+
+    return reference
+
+
+def measure_message(renderer, reference, message):
+    '''
+    The number of tokens a message adds to a rendered prompt, uncached.
+    '''
+    return max(get_encoded_length(renderer(messages=[message])) - reference, 0)
+
+
+def get_message_length(renderer, renderer_key, message):
+    '''
+    measure_message() with the result cached across calls.
+    '''
+    with message_lengths_lock:
+        key = _cache_key(renderer_key, message['role'], message['content'])
+        length = message_lengths.get(key)
+        if length is not None:
+            message_lengths.move_to_end(key)
+            return length
+
+    reference = get_reference_length(renderer, renderer_key, message['role'])
+    length = measure_message(renderer, reference, message)
+    with message_lengths_lock:
+        _cache_put(key, length)
+
+    return length
+
 
 def get_generation_prompt(renderer, impersonate=False, strip_trailing_spaces=True):
     '''
@@ -205,51 +292,95 @@ def generate_chat_prompt(user_input, state, **kwargs):
     prompt = make_prompt(messages)
 
     # Handle truncation
-    if shared.tokenizer is not None:
+    if shared.tokenizer is not None and len(messages) > 0:
         max_length = get_max_prompt_length(state)
         encoded_length = get_encoded_length(prompt)
-        while len(messages) > 0 and encoded_length > max_length:
-
-            # Remove old message, save system message
-            if len(messages) > 2 and messages[0]['role'] == 'system':
-                messages.pop(1)
+        if encoded_length > max_length:
+            if renderer is instruct_renderer:
+                renderer_key = ('instruct', state['instruction_template_str'])
+            else:
+                renderer_key = ('chat', chat_template_str, state['name1'], state['name2'], state['user_bio'])
+
+            # Drop the oldest messages, keeping the system message and the
+            # last one, until their cached lengths cover the excess. Templates
+            # that cannot render a message on its own (strict role
+            # alternation, for instance) fall back to dropping them one at a
+            # time below.
+            start = 1 if messages[0]['role'] == 'system' else 0
+            excess = encoded_length - max_length
+            drop = 0
+            try:
+                for message in messages[start:-1]:
+                    if excess <= 0:
+                        break
+
+                    excess -= get_message_length(renderer, renderer_key, message)
+                    drop += 1
+            except Exception:
+                drop = 0
+
+            if drop > 0:
+                del messages[start:start + drop]
+                prompt = make_prompt(messages)
+                encoded_length = get_encoded_length(prompt)
 
-            # Remove old message when no system message is present
-            elif len(messages) > 1 and messages[0]['role'] != 'system':
-                messages.pop(0)
+            # The lengths are per message, the joined prompt can tokenize a
+            # little differently at the boundaries
+            while encoded_length > max_length and len(messages) - start > 1:
+                messages.pop(start)
+                prompt = make_prompt(messages)
+                encoded_length = get_encoded_length(prompt)
 
             # Resort to truncating the user input
-            else:
-
+            if encoded_length > max_length:
                 user_message = messages[-1]['content']
 
-                # Bisect the truncation point
+                # Bisect on the length of the last message rendered alone,
+                # which is much shorter to tokenize than the whole prompt.
+                # The result is checked against the whole prompt, and only if
+                # it does not fit after all is the bisection continued there.
                 left, right = 0, len(user_message) - 1
+                try:
+                    role = messages[-1]['role']
+                    reference = get_reference_length(renderer, renderer_key, role)
+                    budget = max_length - encoded_length + get_message_length(renderer, renderer_key, messages[-1])
+                    while right - left > 1:
+                        mid = (left + right) // 2
+                        if measure_message(renderer, reference, {"role": role, "content": user_message[:mid]}) <= budget:
+                            left = mid
+                        else:
+                            right = mid
+
+                    messages[-1]['content'] = user_message[:left]
+                    prompt = make_prompt(messages)
+                    encoded_length = get_encoded_length(prompt)
+                    if encoded_length > max_length:
+                        left, right = 0, left
+                except Exception:
+                    left, right = 0, len(user_message) - 1
 
-                while right - left > 1:
-                    mid = (left + right) // 2
+                if encoded_length > max_length:
+                    while right - left > 1:
+                        mid = (left + right) // 2
+
+                        messages[-1]['content'] = user_message[:mid]
+                        prompt = make_prompt(messages)
+                        encoded_length = get_encoded_length(prompt)
 
-                    messages[-1]['content'] = user_message[:mid]
+                        if encoded_length <= max_length:
+                            left = mid
+                        else:
+                            right = mid
+
+                    messages[-1]['content'] = user_message[:left]
                     prompt = make_prompt(messages)
                     encoded_length = get_encoded_length(prompt)
 
-                    if encoded_length <= max_length:
-                        left = mid
-                    else:
-                        right = mid
-
-                messages[-1]['content'] = user_message[:left]
-                prompt = make_prompt(messages)
-                encoded_length = get_encoded_length(prompt)
                 if encoded_length > max_length:
                     logger.error(f"Failed to build the chat prompt. The input is too long for the available context length.\n\nTruncation length: {state['truncation_length']}\nmax_new_tokens: {state['max_new_tokens']} (is it too high?)\nAvailable context length: {max_length}\n")
                     raise ValueError
                 else:
                     logger.warning(f"The input has been truncated. Context length: {state['truncation_length']}, max_new_tokens: {state['max_new_tokens']}, available context length: {max_length}.")
-                    break
-
-            prompt = make_prompt(messages)
-            encoded_length = get_encoded_length(prompt)
 
     if also_return_rows:
         return prompt, [message['content'] for message in messages]
@@ -305,6 +436,39 @@ def get_stopping_strings(state):
     return result
 
 
+class VisibleReply:
+    '''
+    Builds the visible reply (placeholders replaced by name1, html-escaped)
+    from streamed deltas. A tail that could still complete a placeholder is
+    held back from the substitution until the next delta.
+    '''
+
+    PLACEHOLDERS = ('<USER>', '<user>', '{{user}}')
+
+    def __init__(self, name1=None):
+        self.name1 = name1
+        self.text = ''
+        self.carry = ''
+
+    def add(self, delta):
+        if self.name1 is None:
+            self.text += html.escape(delta)
+            return
+
+        raw = self.carry + delta
+        keep = 0
+        for k in range(min(len(raw), max(map(len, self.PLACEHOLDERS)) - 1), 0, -1):
+            if any(p.startswith(raw[-k:]) for p in self.PLACEHOLDERS):
+                keep = k
+                break
+
+        done, self.carry = raw[:len(raw) - keep], raw[len(raw) - keep:]
+        self.text += html.escape(re.sub("(<USER>|<user>|{{user}})", self.name1, done))
+
+    def value(self, cursor=''):
+        return self.text + html.escape(self.carry + cursor)
+
+
 def chatbot_wrapper(text, state, regenerate=False, _continue=False, loading_message=True, for_ui=False):
     history = state['history']
     output = copy.deepcopy(history)
@@ -358,16 +522,18 @@ def chatbot_wrapper(text, state, regenerate=False, _continue=False, loading_mess
         prompt = generate_chat_prompt(text, state, **kwargs)
 
     # Generate
-    reply = None
-    for j, reply in enumerate(generate_reply(prompt, state, stopping_strings=stopping_strings, is_chat=True, for_ui=for_ui)):
+    reply = ''
+    name1 = state['name1'] if state['mode'] in ['chat', 'chat-instruct'] else None
+    visible = VisibleReply(name1)
+    for j, event in enumerate(generate_reply(prompt, state, stopping_strings=stopping_strings, is_chat=True, for_ui=for_ui, deltas=True)):
+        if event.start == 0:
+            reply, visible = '', VisibleReply(name1)
 
         # Extract the reply
-        if state['mode'] in ['chat', 'chat-instruct']:
-            visible_reply = re.sub("(<USER>|<user>|{{user}})", state['name1'], reply + '▍')
-        else:
-            visible_reply = reply + '▍'
-
-        visible_reply = html.escape(visible_reply)
+        new_text = event.text if (_continue or reply) else event.text.lstrip(' ')
+        reply += new_text
+        visible.add(new_text)
+        visible_reply = visible.value('▍')
 
         if shared.stop_everything:
             if output['visible'][-1][1].endswith('▍'):
@@ -383,8 +549,8 @@ def chatbot_wrapper(text, state, regenerate=False, _continue=False, loading_mess
             if is_stream:
                 yield output
         elif not (j == 0 and visible_reply.strip() == ''):
-            output['internal'][-1] = [text, reply.lstrip(' ')]
-            output['visible'][-1] = [visible_text, visible_reply.lstrip(' ')]
+            output['internal'][-1] = [text, reply]
+            output['visible'][-1] = [visible_text, visible_reply]
             if is_stream:
                 yield output
 
@@ -0,0 +1,401 @@
+'''
+Continuous batching for the Transformers loader.
+
+A single scheduler thread owns the model. At every step boundary it admits
+waiting requests (prefilling each prompt and merging its KV cache into the
+running batch), runs one batched forward pass over the last token of every
+active sequence, samples each sequence with its own settings, streams the
+new tokens back to the callers and retires the sequences that finished.
+
+The batch is kept left-padded: shorter sequences have zero attention-mask
+columns at the start, and explicit position ids keep their rotary positions
+right. Leading columns that no sequence uses anymore are trimmed whenever a
+sequence retires.
+'''
+
+import threading
+import traceback
+from collections import deque
+from queue import SimpleQueue
+
+import torch
+import torch.nn.functional as F
+from transformers import DynamicCache
+from transformers.generation.logits_process import (
+    MinPLogitsWarper,
+    TopKLogitsWarper,
+    TopPLogitsWarper
+)
+
+import modules.shared as shared
+from modules.logging_colors import logger
+from modules.presets import default_preset
+from modules.sampler_hijack import (
+    FrequencyPenaltyLogitsProcessor,
+    PresencePenaltyLogitsProcessor,
+    RepetitionPenaltyLogitsProcessorWithRange,
+    TemperatureLogitsWarperCustom
+)
+
+# Samplers and options the scheduler does not implement, with their neutral
+# values. A request that moves any of them away from neutral is generated on
+# its own with model.generate(), as before.
+UNBATCHED_PARAMS = {
+    'dynamic_temperature': False,
+    'smoothing_factor': 0,
+    'typical_p': 1,
+    'xtc_probability': 0,
+    'epsilon_cutoff': 0,
+    'eta_cutoff': 0,
+    'tfs': 1,
+    'top_a': 0,
+    'top_n_sigma': 0,
+    'dry_multiplier': 0,
+    'encoder_repetition_penalty': 1,
+    'no_repeat_ngram_size': 0,
+    'penalty_alpha': 0,
+    'guidance_scale': 1,
+    'mirostat_mode': 0,
+    'prompt_lookup_num_tokens': 0,
+    'static_cache': False,
+    'negative_prompt': '',
+}
+
+# build_processors() applies the samplers in this order only
+DEFAULT_SAMPLER_PRIORITY = default_preset()['sampler_priority'].split('\n')
+
+
+def is_enabled():
+    return (
+        shared.batch_scheduler is not None
+        and shared.args.loader == 'Transformers'
+        and shared.model is not None
+        and not shared.is_seq2seq
+        and not shared.args.deepspeed
+        and not shared.args.no_cache
+    )
+
+
+def can_batch(state):
+    '''
+    Whether a request with these generation parameters can join the batch.
+
+    Callers that read sampler_hijack.global_scores afterwards, which only
+    model.generate() sets, opt out with state['continuous_batching'] = False.
+    '''
+    if not is_enabled() or not state.get('continuous_batching', True):
+        return False
+
+    priority = state.get('sampler_priority')
+    if isinstance(priority, str):
+        priority = [x.strip() for x in priority.replace('\n', ',').split(',') if x.strip()]
+
+    if priority and list(priority) != DEFAULT_SAMPLER_PRIORITY:
+        return False
+
+    return all(state.get(k, neutral) == neutral for k, neutral in UNBATCHED_PARAMS.items())
+
+
+class Sequence:
+    '''
+    One request in the batch. Iterating over it yields the generated token
+    ids as the scheduler produces them; the EOS token is not yielded.
+    '''
+
+    def __init__(self, input_ids, state, max_new_tokens, eos_token_ids, suppress_tokens=None, seed=-1):
+        self.ids = [int(x) for x in input_ids]
+        self.device = input_ids.device
+        self.prompt_length = len(self.ids)
+        self.max_new_tokens = max_new_tokens
+        self.eos_token_ids = set(eos_token_ids)
+        self.suppress_tokens = list(suppress_tokens or [])
+        self.seed = seed
+        self.generator = None
+        self.finished = False
+        self.cancelled = False
+        self.queue = SimpleQueue()
+
+        self.do_sample = state['do_sample'] and state['temperature'] > 0
+        self.penalties, self.warpers = build_processors(state, self.do_sample)
+
+    @property
+    def new_tokens(self):
+        return len(self.ids) - self.prompt_length
+
+    def sample(self, logits):
+        if self.suppress_tokens:
+            logits[:, self.suppress_tokens] = -float('inf')
+
+        if self.penalties:
+            input_ids = torch.tensor([self.ids], device=logits.device)
+            for processor in self.penalties:
+                logits = processor(input_ids, logits)
+
+        if not self.do_sample:
+            return int(logits.argmax(dim=-1))
+
+        for warper in self.warpers:
+            logits = warper(None, logits)
+
+        if self.generator is None:
+            self.generator = torch.Generator(device=logits.device)
+            self.generator.manual_seed(self.seed)
+
+        probs = F.softmax(logits, dim=-1)
+        return int(torch.multinomial(probs, 1, generator=self.generator))
+
+    def push(self, token):
+        if token in self.eos_token_ids:
+            self.finished = True
+            return
+
+        self.ids.append(token)
+        self.queue.put(token)
+        if self.new_tokens >= self.max_new_tokens:
+            self.finished = True
+
+    def finish(self):
+        self.finished = True
+        self.queue.put(None)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def __iter__(self):
+        while True:
+            token = self.queue.get()
+            if token is None:
+                return
+
+            yield token
+
+
+def build_processors(state, do_sample):
+    '''
+    The penalties and warpers of a request, in the default sampler priority
+    order. temperature_last moves the temperature after the truncation samplers.
+    '''
+    penalties = []
+    _range = state['repetition_penalty_range']
+    if state['repetition_penalty'] != 1:
+        penalties.append(RepetitionPenaltyLogitsProcessorWithRange(state['repetition_penalty'], _range))
+    if state['presence_penalty'] != 0:
+        penalties.append(PresencePenaltyLogitsProcessor(state['presence_penalty'], _range))
+    if state['frequency_penalty'] != 0:
+        penalties.append(FrequencyPenaltyLogitsProcessor(state['frequency_penalty'], _range))
+
+    warpers = []
+    if not do_sample:
+        return penalties, warpers
+
+    if state['top_k'] > 0:
+        warpers.append(TopKLogitsWarper(int(state['top_k'])))
+    if state['top_p'] < 1:
+        warpers.append(TopPLogitsWarper(float(state['top_p'])))
+    if state['min_p'] > 0:
+        warpers.append(MinPLogitsWarper(float(state['min_p'])))
+
+    if state['temperature'] != 1:
+        temperature = TemperatureLogitsWarperCustom(float(state['temperature']))
+        if state['temperature_last']:
+            warpers.append(temperature)
+        else:
+            warpers.insert(0, temperature)
+
+    return penalties, warpers
+
+
+def _left_pad(past, mask, length):
+    pad = length - mask.shape[1]
+    if pad == 0:
+        return past, mask
+
+    past = tuple((F.pad(k, (0, 0, pad, 0)), F.pad(v, (0, 0, pad, 0))) for k, v in past)
+    return past, F.pad(mask, (pad, 0))
+
+
+class BatchScheduler:
+    '''
+    Runs every batchable request through one shared decoding loop.
+
+    Model access happens under shared.generation_lock, taken once per
+    prefill and once per batched step, so requests that cannot be batched,
+    logits inspection and idle unloading interleave with the batch at step
+    boundaries.
+    '''
+
+    def __init__(self, max_batch_size=8):
+        self.max_batch_size = max_batch_size
+        self.waiting = deque()
+        self.active = []
+        self.cache = None
+        self.mask = None
+        self.model = None
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def submit(self, input_ids, state, max_new_tokens, eos_token_ids, suppress_tokens=None, seed=-1):
+        '''
+        Queue a prompt (a 1-D tensor of token ids) and return its Sequence.
+        '''
+        sequence = Sequence(input_ids, state, max_new_tokens, eos_token_ids, suppress_tokens, seed)
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._loop, name='batch-scheduler', daemon=True)
+                self.thread.start()
+
+            self.waiting.append(sequence)
+            self.condition.notify()
+
+        return sequence
+
+    def _loop(self):
+        while True:
+            with self.condition:
+                while not self.waiting and not self.active:
+                    self.condition.wait()
+
+                admitted = []
+                while self.waiting and len(self.active) + len(admitted) < self.max_batch_size:
+                    sequence = self.waiting.popleft()
+                    if not sequence.cancelled:
+                        admitted.append(sequence)
+
+            try:
+                with shared.generation_lock:
+                    self._check_model(admitted)
+                    for sequence in admitted:
+                        self._admit(sequence)
+
+                    if self.active:
+                        self._step()
+
+                self._retire()
+            except Exception:
+                # Keep the thread alive, or every caller would wait forever
+                traceback.print_exc()
+                self._abort(admitted)
+
+    def _abort(self, admitted):
+        with self.condition:
+            waiting = list(self.waiting)
+            self.waiting.clear()
+
+        # finish() may end a sequence twice, its iterator stops at the first
+        for sequence in self.active + admitted + waiting:
+            sequence.finish()
+
+        self.active = []
+        self.cache = None
+        self.mask = None
+
+    def _check_model(self, admitted):
+        if shared.model is self.model:
+            return
+
+        # The model was unloaded or replaced, the cache belongs to the old one
+        if self.active:
+            logger.warning(f'Model changed during generation; ending {len(self.active)} batched sequences.')
+            for sequence in self.active:
+                sequence.finish()
+
+        self.active = []
+        self.cache = None
+        self.mask = None
+        self.model = shared.model
+        if self.model is None:
+            for sequence in admitted:
+                sequence.finish()
+
+            admitted.clear()
+
+    def _admit(self, sequence):
+        try:
+            input_ids = torch.tensor([sequence.ids], device=sequence.device)
+            with torch.no_grad():
+                output = self.model(input_ids=input_ids, past_key_values=DynamicCache(), use_cache=True)
+
+            sequence.push(sequence.sample(output.logits[:, -1, :].float()))
+        except Exception:
+            traceback.print_exc()
+            sequence.finish()
+            return
+
+        if sequence.finished:
+            sequence.finish()
+            return
+
+        past = output.past_key_values.to_legacy_cache()
+        mask = torch.ones_like(input_ids)
+        if self.cache is None:
+            self.cache, self.mask = DynamicCache.from_legacy_cache(past), mask
+        else:
+            length = max(self.mask.shape[1], mask.shape[1])
+            batch_past, batch_mask = _left_pad(self.cache.to_legacy_cache(), self.mask, length)
+            past, mask = _left_pad(past, mask.to(batch_mask.device), length)
+            merged = tuple(
+                (torch.cat([bk, k.to(bk.device)]), torch.cat([bv, v.to(bv.device)]))
+                for (bk, bv), (k, v) in zip(batch_past, past)
+            )
+            self.cache = DynamicCache.from_legacy_cache(merged)
+            self.mask = torch.cat([batch_mask, mask])
+
+        self.active.append(sequence)
+
+    def _step(self):
+        try:
+            input_ids = torch.tensor([[s.ids[-1]] for s in self.active], device=self.mask.device)
+            self.mask = torch.cat([self.mask, self.mask.new_ones((len(self.active), 1))], dim=1)
+            position_ids = self.mask.sum(dim=-1, keepdim=True) - 1
+            cache_position = torch.tensor([self.mask.shape[1] - 1], device=self.mask.device)
+            with torch.no_grad():
+                output = self.model(
+                    input_ids=input_ids,
+                    attention_mask=self.mask,
+                    position_ids=position_ids,
+                    past_key_values=self.cache,
+                    cache_position=cache_position,
+                    use_cache=True
+                )
+
+            self.cache = output.past_key_values
+            logits = output.logits[:, -1, :].float()
+            for i, sequence in enumerate(self.active):
+                sequence.push(sequence.sample(logits[i:i + 1]))
+        except Exception:
+            traceback.print_exc()
+            for sequence in self.active:
+                sequence.finish()
+
+            self.active = []
+            self.cache = None
+            self.mask = None
+
+    def _retire(self):
+        keep = []
+        for i, sequence in enumerate(self.active):
+            if sequence.finished or sequence.cancelled:
+                sequence.finish()
+            else:
+                keep.append(i)
+
+        if len(keep) == len(self.active):
+            return
+
+        self.active = [self.active[i] for i in keep]
+        if not self.active:
+            self.cache = None
+            self.mask = None
+            return
+
+        index = torch.tensor(keep, device=self.mask.device)
+        mask = self.mask[index]
+
+        # Drop the leading columns that only retired sequences were using
+        start = int((mask.sum(dim=0) == 0).long().cumprod(dim=0).sum())
+        past = tuple(
+            (k[index.to(k.device), :, start:], v[index.to(v.device), :, start:])
+            for k, v in self.cache.to_legacy_cache()
+        )
+        self.cache = DynamicCache.from_legacy_cache(past)
+        self.mask = mask[:, start:]
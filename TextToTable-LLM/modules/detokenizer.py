@@ -0,0 +1,61 @@
+'''
+Incremental detokenization for streaming.
+
+Decoding only the newest token loses context: SentencePiece drops the
+leading space of a word-initial token, and a character split across
+several byte tokens decodes to U+FFFD until its last byte arrives. Decoding
+everything generated so far at every step gets both right but costs
+O(length) per token.
+
+IncrementalDetokenizer keeps two offsets into the token ids. prefix_offset
+marks a few tokens of already emitted context, and read_offset marks the
+end of the text emitted so far. Each step decodes only ids[prefix_offset:]
+and emits what that text adds beyond ids[prefix_offset:read_offset]. The
+step cost is therefore bounded by the size of the pending fragment, not by
+the length of the reply.
+'''
+
+# Tokens of the prompt used as decoding context for the first reply tokens
+INITIAL_CONTEXT = 5
+
+
+class IncrementalDetokenizer:
+    def __init__(self, tokenizer, prompt_ids=(), skip_special_tokens=True):
+        self.tokenizer = tokenizer
+        self.skip_special_tokens = skip_special_tokens
+        self.ids = [int(x) for x in prompt_ids]
+        self.read_offset = len(self.ids)
+        self.prefix_offset = max(self.read_offset - INITIAL_CONTEXT, 0)
+
+    def decode(self, ids):
+        return self.tokenizer.decode(ids, skip_special_tokens=self.skip_special_tokens)
+
+    def step(self, output_ids):
+        '''
+        Feed the full output so far (a list or a 1-D tensor whose start
+        matches what was fed before) and return the newly finalized text.
+
+        Only the ids past those already seen are converted, so a tensor on
+        the GPU is synchronized for the new tokens alone.
+        '''
+        new_ids = output_ids[len(self.ids):]
+        if hasattr(new_ids, 'tolist'):
+            new_ids = new_ids.tolist()
+
+        return self.add(new_ids)
+
+    def add(self, new_ids):
+        '''
+        Append token ids and return the newly finalized text, or '' while
+        the tail is an incomplete multi-byte character.
+        '''
+        self.ids.extend(int(x) for x in new_ids)
+        prefix_text = self.decode(self.ids[self.prefix_offset:self.read_offset])
+        new_text = self.decode(self.ids[self.prefix_offset:])
+
+        if len(new_text) <= len(prefix_text) or new_text.endswith(chr(0xfffd)):
+            return ''
+
+        self.prefix_offset = self.read_offset
+        self.read_offset = len(self.ids)
+        return new_text[len(prefix_text):]
@@ -18,7 +18,7 @@ from exllamav2.generator import ExLlamaV2Sampler, ExLlamaV2StreamingGenerator
 
 from modules import shared
 from modules.logging_colors import logger
-from modules.text_generation import get_max_prompt_length
+from modules.text_generation import ReplyDelta, get_max_prompt_length
 
 try:
     import flash_attn
@@ -152,7 +152,10 @@ class Exllamav2Model:
 
         return self.model.forward(token_ids[:, -1:], self.cache, input_mask=None, loras=self.loras, **kwargs).float().cpu()
 
-    def generate_with_streaming(self, prompt, state):
+    def generate_with_streaming(self, prompt, state, deltas=False):
+        """
+        Yields the cumulative reply, or ReplyDelta events with deltas=True
+        """
         settings = ExLlamaV2Sampler.Settings()
 
         settings.token_repetition_penalty = state['repetition_penalty']
@@ -225,13 +228,18 @@ class Exllamav2Model:
         self.generator.begin_stream(ids, settings, loras=self.loras)
 
         decoded_text = ''
+        length = 0
         for i in range(max_new_tokens):
             chunk, eos, _ = self.generator.stream()
             if eos or shared.stop_everything:
                 break
 
-            decoded_text += chunk
-            yield decoded_text
+            if deltas:
+                length += len(chunk)
+                yield ReplyDelta(chunk, length)
+            else:
+                decoded_text += chunk
+                yield decoded_text
 
         # Log speculative decoding stats if using draft model
         if hasattr(self, 'draft_model') and self.draft_model is not None:
@@ -14,6 +14,7 @@ import requests
 
 from modules import shared
 from modules.logging_colors import logger
+from modules.text_generation import ReplyDelta
 
 llamacpp_valid_cache_types = {"fp16", "q8_0", "q4_0"}
 
@@ -121,7 +122,10 @@ class LlamaServer:
 
         return payload
 
-    def generate_with_streaming(self, prompt, state):
+    def generate_with_streaming(self, prompt, state, deltas=False):
+        """
+        Yields the cumulative reply, or ReplyDelta events with deltas=True
+        """
         url = f"http://127.0.0.1:{self.port}/completion"
         payload = self.prepare_payload(state)
 
@@ -148,6 +152,7 @@ class LlamaServer:
             response.raise_for_status()  # Raise an exception for HTTP errors
 
             full_text = ""
+            length = 0
 
             # Process the streaming response
             for line in response.iter_lines():
@@ -169,8 +174,12 @@ class LlamaServer:
 
                     # Extract the token content
                     if data.get('content', ''):
-                        full_text += data['content']
-                        yield full_text
+                        if deltas:
+                            length += len(data['content'])
+                            yield ReplyDelta(data['content'], length)
+                        else:
+                            full_text += data['content']
+                            yield full_text
 
                     # Check if generation is complete
                     if data.get('stop', False):
@@ -76,6 +76,8 @@ def _get_next_logits(prompt, state, use_samplers, previous, top_logits=25, retur
 
             state['max_new_tokens'] = 1
             state['auto_max_new_tokens'] = False
+            # the batch scheduler does not publish global_scores
+            state['continuous_batching'] = False
             for _ in generate_reply(prompt, state):
                 pass
 
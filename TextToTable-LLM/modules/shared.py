@@ -21,6 +21,7 @@ lora_names = []
 # Generation variables
 stop_everything = False
 generation_lock = None
+batch_scheduler = None
 processing_message = '*Is typing...*'
 
 # UI variables
@@ -104,6 +105,8 @@ group.add_argument('--no_use_fast', action='store_true', help='Set use_fast=Fals
 group.add_argument('--use_flash_attention_2', action='store_true', help='Set use_flash_attention_2=True while loading the model.')
 group.add_argument('--use_eager_attention', action='store_true', help='Set attn_implementation= eager while loading the model.')
 group.add_argument('--torch-compile', action='store_true', help='Compile the model with torch.compile for improved performance.')
+group.add_argument('--continuous-batching', action='store_true', help='Decode concurrent requests together in one batch, admitting new ones between steps, instead of one request at a time.')
+group.add_argument('--max-batch-size', type=int, default=8, help='Maximum number of sequences decoded together with --continuous-batching.')
 
 # bitsandbytes 4-bit
 group = parser.add_argument_group('bitsandbytes 4-bit')
@@ -6,6 +6,7 @@ import tensorrt_llm
 from modules import shared
 from modules.logging_colors import logger
 from modules.text_generation import (
+    ReplyDelta,
     get_max_prompt_length,
     get_reply_from_output_ids
 )
@@ -54,7 +55,10 @@ class TensorRTLLMModel:
 
         return result
 
-    def generate_with_streaming(self, prompt, state):
+    def generate_with_streaming(self, prompt, state, deltas=False):
+        """
+        Yields the cumulative reply, or ReplyDelta events with deltas=True
+        """
         batch_input_ids = []
         input_ids = shared.tokenizer.encode(
             prompt,
@@ -102,6 +106,7 @@ class TensorRTLLMModel:
         torch.cuda.synchronize()
 
         cumulative_reply = ''
+        length = 0
         starting_from = batch_input_ids[0].shape[-1]
 
         if shared.args.cpp_runner:
@@ -110,7 +115,7 @@ class TensorRTLLMModel:
 
             cumulative_reply += get_reply_from_output_ids(output_ids, state, starting_from=starting_from)
             starting_from = sequence_length
-            yield cumulative_reply
+            yield ReplyDelta(cumulative_reply, len(cumulative_reply)) if deltas else cumulative_reply
         else:
             for curr_outputs in generator:
                 if shared.stop_everything:
@@ -119,9 +124,14 @@ class TensorRTLLMModel:
                 sequence_length = curr_outputs['sequence_lengths'][0].item()
                 output_ids = curr_outputs['output_ids'][0][0][:sequence_length].tolist()
 
-                cumulative_reply += get_reply_from_output_ids(output_ids, state, starting_from=starting_from)
+                new_content = get_reply_from_output_ids(output_ids, state, starting_from=starting_from)
                 starting_from = sequence_length
-                yield cumulative_reply
+                if deltas:
+                    length += len(new_content)
+                    yield ReplyDelta(new_content, length)
+                else:
+                    cumulative_reply += new_content
+                    yield cumulative_reply
 
     def generate(self, prompt, state):
         output = ''
@@ -5,29 +5,102 @@ import pprint
 import random
 import time
 import traceback
+from collections import deque
+from typing import NamedTuple
 
 import numpy as np
 
 import modules.shared as shared
 from modules import models
 from modules.callbacks import Iteratorize
+from modules.detokenizer import IncrementalDetokenizer
 from modules.extensions import apply_extensions
 from modules.html_generator import generate_basic_html
 from modules.logging_colors import logger
 
 
-def generate_reply(*args, **kwargs):
+class ReplyDelta(NamedTuple):
+    """
+    One streamed change to a reply: the reply becomes
+    reply[:length - len(text)] + text.
+
+    Generators only ever append, so start == the previous length, except
+    for a rewrite, which replaces the whole reply (start == 0).
+    """
+    text: str
+    length: int
+
+    @property
+    def start(self):
+        return self.length - len(self.text)
+
+    def apply(self, reply):
+        return reply[:self.start] + self.text
+
+
+def as_deltas(replies):
+    """
+    Turns a generator of cumulative replies into ReplyDelta events. Items
+    that already are ReplyDelta events pass through unchanged.
+    """
+    length, last_char = 0, ''
+    for reply in replies:
+        if isinstance(reply, ReplyDelta):
+            event = reply
+        elif len(reply) >= length and (length == 0 or reply[length - 1] == last_char):
+            event = ReplyDelta(reply[length:], len(reply))
+        else:
+            event = ReplyDelta(reply, len(reply))
+
+        length = event.length
+        if event.text:
+            last_char = event.text[-1]
+        elif length == 0:
+            last_char = ''
+
+        yield event
+
+
+def cumulative(events):
+    """
+    Materializes the full reply after each ReplyDelta event.
+    """
+    reply = ''
+    for event in events:
+        reply = event.apply(reply)
+        yield reply
+
+
+def generate_reply(*args, deltas=False, **kwargs):
+    """
+    Yields the cumulative reply after each update, or ReplyDelta events
+    with deltas=True.
+    """
     if shared.args.idle_timeout > 0 and shared.model is None and shared.model_name not in [None, 'None']:
         from modules.models import load_model
         shared.model, shared.tokenizer = load_model(shared.model_name)
 
-    shared.generation_lock.acquire()
+    # With continuous batching the lock is taken further down, per decoding
+    # step by the scheduler and per request for everything it cannot batch
+    batching = shared.batch_scheduler is not None
+    if not batching:
+        shared.generation_lock.acquire()
+
     try:
-        for result in _generate_reply(*args, **kwargs):
-            yield result
+        events = _generate_reply(*args, **kwargs)
+        yield from (events if deltas else cumulative(events))
     finally:
         models.last_generation_time = time.time()
-        shared.generation_lock.release()
+        if not batching:
+            shared.generation_lock.release()
+
+
+def _with_generation_lock(generate_func):
+    def locked(*args, **kwargs):
+        with shared.generation_lock:
+            yield from generate_func(*args, **kwargs)
+
+    return locked
 
 
 def _generate_reply(question, state, stopping_strings=None, is_chat=False, escape_html=False, for_ui=False):
@@ -36,7 +109,7 @@ def _generate_reply(question, state, stopping_strings=None, is_chat=False, escap
     if generate_func is None:
         if shared.model_name == 'None' or shared.model is None:
             logger.error("No model is loaded! Select one in the Model tab.")
-            yield ''
+            yield ReplyDelta('', 0)
             return
 
         if shared.model.__class__.__name__ in ['LlamaServer', 'Exllamav2Model', 'TensorRTLLMModel']:
@@ -44,6 +117,9 @@ def _generate_reply(question, state, stopping_strings=None, is_chat=False, escap
         else:
             generate_func = generate_reply_HF
 
+    if shared.batch_scheduler is not None and generate_func != generate_reply_HF:
+        generate_func = _with_generation_lock(generate_func)
+
     if generate_func != generate_reply_HF and shared.args.verbose:
         logger.info("PROMPT=")
         print_prompt(question)
@@ -65,7 +141,6 @@ def _generate_reply(question, state, stopping_strings=None, is_chat=False, escap
 
     shared.stop_everything = False
     last_update = -1
-    reply = ''
     is_stream = state['stream']
     if len(all_stop_strings) > 0 and not state['stream']:
         state = copy.deepcopy(state)
@@ -75,11 +150,31 @@ def _generate_reply(question, state, stopping_strings=None, is_chat=False, escap
     if state.get('max_updates_second', 0) > 0:
         min_update_interval = 1 / state['max_updates_second']
 
+    # Each stage below only sees the new text of every event
+    stop_matcher = StopStringMatcher(all_stop_strings)
+    released = 0  # raw text cleared by the stop matcher
+    held = ''  # raw text after that, possibly the start of a stopping string
+    parts = []  # the reply as yielded, joined only for output extensions
+    length = 0
+    unsent = []  # text not yielded yet
+
     # Generate
-    for reply in generate_func(question, original_question, state, stopping_strings, is_chat=is_chat):
-        reply, stop_found = apply_stopping_strings(reply, all_stop_strings)
+    for event in as_deltas(generate_func(question, original_question, state, stopping_strings, is_chat=is_chat)):
+        if event.start < released + len(held):
+            # The generator rewrote its reply, start over
+            stop_matcher.reset()
+            released, held, parts, length, unsent = 0, '', [], 0, []
+
+        held += event.text
+        final, stop_found = stop_matcher.push(event.text)
+        text, held = held[:final - released], held[final - released:]
+        released = final
         if escape_html:
-            reply = html.escape(reply)
+            text = html.escape(text)
+
+        parts.append(text)
+        unsent.append(text)
+        length += len(text)
 
         if is_stream:
             cur_time = time.time()
@@ -91,24 +186,27 @@ def _generate_reply(question, state, stopping_strings=None, is_chat=False, escap
                     time.sleep(diff)
 
                 last_update = time.time()
-                yield reply
+                yield ReplyDelta(''.join(unsent), length)
+                unsent = []
 
             # Limit updates to avoid lag in the Gradio UI
             # API updates are not limited
-            else:
-                if cur_time - last_update > min_update_interval:
-                    last_update = cur_time
-                    yield reply
-
-                yield reply
+            elif not for_ui or cur_time - last_update > min_update_interval:
+                last_update = cur_time
+                yield ReplyDelta(''.join(unsent), length)
+                unsent = []
 
         if stop_found or (state['max_tokens_second'] > 0 and shared.stop_everything):
             break
 
     if not is_chat:
-        reply = apply_extensions('output', reply, state)
+        reply = ''.join(parts)
+        output = apply_extensions('output', reply, state)
+        if output != reply:
+            yield ReplyDelta(output, len(output))
+            return
 
-    yield reply
+    yield ReplyDelta(''.join(unsent), length)
 
 
 def encode(prompt, add_special_tokens=True, add_bos_token=True, truncation_length=None):
@@ -239,28 +337,96 @@ def stop_everything_event():
 
 
 def apply_stopping_strings(reply, all_stop_strings):
-    stop_found = False
-    for string in all_stop_strings:
-        idx = reply.find(string)
-        if idx != -1:
-            reply = reply[:idx]
-            stop_found = True
-            break
+    return StopStringMatcher(all_stop_strings).feed(reply)
 
-    if not stop_found:
-        # If something like "\nYo" is generated just before "\nYou:"
-        # is completed, trim it
-        for string in all_stop_strings:
-            for j in range(len(string) - 1, 0, -1):
-                if reply[-j:] == string[:j]:
-                    reply = reply[:-j]
-                    break
-            else:
-                continue
 
-            break
+class StopStringMatcher:
+    """
+    Aho-Corasick automaton over the stopping strings of one request.
 
-    return reply, stop_found
+    push() takes the text added since the previous call, feed() the
+    cumulative reply; either way only new characters are scanned. The reply
+    is cut before the first complete stopping string, or else before a
+    trailing partial one (e.g. "\nYo" generated just before "\nYou:" is
+    completed).
+    """
+
+    def __init__(self, stop_strings):
+        self.goto = [{}]
+        self.fail = [0]
+        self.depth = [0]
+        # Length of the longest stopping string ending at each state
+        self.match = [0]
+
+        for string in stop_strings:
+            if not string:
+                continue
+
+            node = 0
+            for ch in string:
+                if ch not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.depth.append(self.depth[node] + 1)
+                    self.match.append(0)
+                    self.goto[node][ch] = len(self.goto) - 1
+
+                node = self.goto[node][ch]
+
+            self.match[node] = max(self.match[node], len(string))
+
+        # Breadth-first, so the fail link of each node is complete before its children
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                fallback = self.fail[node]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+
+                self.fail[child] = self.goto[fallback].get(ch, 0)
+                self.match[child] = max(self.match[child], self.match[self.fail[child]])
+                queue.append(child)
+
+        self.reset()
+
+    def reset(self):
+        self.state = 0
+        self.scanned = 0
+        self.last_char = ''
+
+    def feed(self, reply):
+        # The reply is expected to grow by appending; rescan if it did not
+        if len(reply) < self.scanned or (self.scanned and reply[self.scanned - 1] != self.last_char):
+            self.reset()
+
+        length, stop_found = self.push(reply[self.scanned:])
+        self.last_char = reply[-1] if reply else ''
+        return reply[:length], stop_found
+
+    def push(self, text):
+        """
+        Scans text appended to everything pushed before. Returns the length
+        of the reply that is final and whether a stopping string was found;
+        in that case the length is where the stopping string starts.
+        """
+        if len(self.goto) == 1:
+            self.scanned += len(text)
+            return self.scanned, False
+
+        goto, fail, match = self.goto, self.fail, self.match
+        state = self.state
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+
+            state = goto[state].get(ch, 0)
+            if match[state]:
+                return self.scanned + i + 1 - match[state], True
+
+        self.state = state
+        self.scanned += len(text)
+        return self.scanned - self.depth[state], False
 
 
 def get_reply_from_output_ids(output_ids, state=None, starting_from=0):
@@ -293,6 +459,7 @@ def generate_reply_HF(question, original_question, state, stopping_strings=None,
     import transformers
     from transformers import LogitsProcessorList
 
+    from modules import continuous_batching
     from modules.grammar.grammar_utils import initialize_grammar
     from modules.grammar.logits_process import (
         GrammarConstrainedLogitsProcessor
@@ -423,7 +590,15 @@ def generate_reply_HF(question, original_question, state, stopping_strings=None,
         logger.info("PROMPT=")
         print_prompt(decode(input_ids[0], skip_special_tokens=False))
 
+    if len(processor) == 0 and inputs_embeds is None and continuous_batching.can_batch(state):
+        yield from generate_reply_batched(input_ids, state, generate_params, eos_token_ids, seed, is_chat=is_chat)
+        return
+
     t0 = time.time()
+    locked = shared.batch_scheduler is not None
+    if locked:
+        shared.generation_lock.acquire()
+
     try:
         if not is_chat and not shared.is_seq2seq:
             yield ''
@@ -452,24 +627,26 @@ def generate_reply_HF(question, original_question, state, stopping_strings=None,
                 return Iteratorize(generate_with_callback, [], kwargs, callback=None)
 
             with generate_with_streaming(**generate_params) as generator:
-                cumulative_reply = ''
-                starting_from = 0 if shared.is_seq2seq else len(input_ids[0])
+                reply_length = 0
+                prompt_ids = [] if shared.is_seq2seq else input_ids[0]
+                detokenizer = IncrementalDetokenizer(shared.tokenizer, prompt_ids, state['skip_special_tokens'])
                 for output in generator:
                     if output[-1] in eos_token_ids:
                         break
 
-                    new_content = get_reply_from_output_ids(output, state, starting_from=starting_from)
-                    # check the partial unicode character
-                    if chr(0xfffd) in new_content:
+                    new_content = detokenizer.step(output)
+                    if not new_content:
                         continue
 
-                    cumulative_reply += new_content
-                    starting_from = len(output)
-                    yield cumulative_reply
+                    reply_length += len(new_content)
+                    yield ReplyDelta(new_content, reply_length)
 
     except Exception:
         traceback.print_exc()
     finally:
+        if locked:
+            shared.generation_lock.release()
+
         t1 = time.time()
         original_tokens = len(original_input_ids[0])
         new_tokens = len(output) - (original_tokens if not shared.is_seq2seq else 0)
@@ -477,6 +654,56 @@ def generate_reply_HF(question, original_question, state, stopping_strings=None,
         return
 
 
+def generate_reply_batched(input_ids, state, generate_params, eos_token_ids, seed, is_chat=False):
+    """
+    Streams a reply decoded by the continuous-batching scheduler
+    """
+    sequence = shared.batch_scheduler.submit(
+        input_ids[0],
+        state,
+        generate_params['max_new_tokens'],
+        eos_token_ids,
+        suppress_tokens=generate_params.get('suppress_tokens'),
+        seed=seed
+    )
+
+    output = input_ids[0].tolist()
+    original_tokens = len(output)
+    t0 = time.time()
+    try:
+        if not is_chat:
+            yield ''
+
+        reply_length = 0
+        detokenizer = IncrementalDetokenizer(shared.tokenizer, output, state['skip_special_tokens'])
+        for token in sequence:
+            output.append(token)
+            if shared.stop_everything:
+                break
+
+            if not state['stream']:
+                continue
+
+            new_content = detokenizer.add([token])
+            if not new_content:
+                continue
+
+            reply_length += len(new_content)
+            yield ReplyDelta(new_content, reply_length)
+
+        if not state['stream']:
+            yield get_reply_from_output_ids(output, state, starting_from=original_tokens)
+
+    except Exception:
+        traceback.print_exc()
+    finally:
+        sequence.cancel()
+        t1 = time.time()
+        new_tokens = len(output) - original_tokens
+        print(f'Output generated in {(t1-t0):.2f} seconds ({new_tokens/(t1-t0):.2f} tokens/s, {new_tokens} tokens, context {original_tokens}, seed {seed}, batched)')
+        return
+
+
 def generate_reply_custom(question, original_question, state, stopping_strings=None, is_chat=False):
     """
     For models that do not use the transformers library for sampling
@@ -484,22 +711,24 @@ def generate_reply_custom(question, original_question, state, stopping_strings=N
 
     seed = set_manual_seed(state['seed'])
     t0 = time.time()
-    reply = ''
+    parts = []
     try:
         if not is_chat:
             yield ''
 
         if not state['stream']:
-            reply = shared.model.generate(question, state)
-            yield reply
+            parts.append(shared.model.generate(question, state))
+            yield parts[0]
         else:
-            for reply in shared.model.generate_with_streaming(question, state):
-                yield reply
+            for event in shared.model.generate_with_streaming(question, state, deltas=True):
+                parts.append(event.text)
+                yield event
 
     except Exception:
         traceback.print_exc()
     finally:
         t1 = time.time()
+        reply = ''.join(parts)
         original_tokens = len(encode(original_question)[0])
         new_tokens = len(encode(original_question + reply)[0]) - original_tokens
         print(f'Output generated in {(t1-t0):.2f} seconds ({new_tokens/(t1-t0):.2f} tokens/s, {new_tokens} tokens, context {original_tokens}, seed {seed})')
@@ -253,6 +253,9 @@ if __name__ == "__main__":
             add_lora_to_model(shared.args.lora)
 
     shared.generation_lock = Lock()
+    if shared.args.continuous_batching:
+        from modules.continuous_batching import BatchScheduler
+        shared.batch_scheduler = BatchScheduler(shared.args.max_batch_size)
 
     if shared.args.idle_timeout > 0:
         timer_thread = Thread(target=unload_model_if_idle)
@@ -0,0 +1,14 @@
+import sys
+from pathlib import Path
+from unittest import mock
+
+# modules.shared parses the command line on import
+sys.argv = sys.argv[:1]
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# Stand-ins for what the modules under test import but a checkout without
+# the css/ assets and the extensions/ folder cannot load: html_generator
+# and ui read stylesheets at import time, and modules.extensions imports
+# the user's extensions package.
+for name in ('extensions', 'modules.html_generator', 'modules.ui'):
+    sys.modules.setdefault(name, mock.MagicMock(name=name))
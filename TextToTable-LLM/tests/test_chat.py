@@ -0,0 +1,171 @@
+import random
+import re
+
+import pytest
+
+import modules.chat as chat
+import modules.shared as shared
+
+# Reads messages[0] like the Qwen2.5 and Llama 3 templates, so it cannot
+# render an empty list
+QWEN_TEMPLATE = (
+    "{%- if messages[0]['role'] == 'system' %}"
+    "{{- '<|im_start|>system\\n' + messages[0]['content'] + '<|im_end|>\\n' }}"
+    "{%- else %}"
+    "{{- '<|im_start|>system\\nYou are a helpful assistant.<|im_end|>\\n' }}"
+    "{%- endif %}"
+    "{%- for message in messages %}"
+    "{%- if not (message['role'] == 'system' and loop.first) %}"
+    "{{- '<|im_start|>' + message['role'] + '\\n' + message['content'] + '<|im_end|>\\n' }}"
+    "{%- endif %}"
+    "{%- endfor %}"
+)
+
+WORDS = "the table lists quarterly revenue by region and product line with growth".split()
+
+
+def encoded_length(prompt):
+    return len(re.findall(r"\w+|[^\w\s]", prompt)) + 1
+
+
+def text(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+
+@pytest.fixture(autouse=True)
+def fake_tokenizer(monkeypatch):
+    monkeypatch.setattr(chat, 'get_encoded_length', encoded_length)
+    monkeypatch.setattr(chat, 'apply_extensions', lambda kind, text, *args, **kwargs: text)
+    monkeypatch.setattr(shared, 'tokenizer', object())
+    monkeypatch.setattr(shared, 'model_name', 'test')
+    chat.message_lengths.clear()
+
+
+def make_state(history, mode, truncation_length, template=None):
+    state = dict(shared.settings)
+    state.update(
+        mode=mode,
+        history={'internal': history, 'visible': history},
+        name1='You',
+        name2='Ann',
+        context='You are helpful.',
+        user_bio='',
+        custom_system_message='',
+        truncation_length=truncation_length,
+        max_new_tokens=100,
+    )
+    if template is not None:
+        state['instruction_template_str'] = template
+
+    return state
+
+
+def untruncated_prompt(history, user_input, state):
+    '''
+    The prompt of the first history suffix that fits, dropping one message at
+    a time from the oldest, as the truncation did before the planner.
+    '''
+    tokenizer = shared.tokenizer
+    shared.tokenizer = None
+    try:
+        for i in range(2 * len(history) + 1):
+            turn, is_assistant = divmod(i, 2)
+            suffix = history[turn:]
+            if is_assistant:
+                suffix = [['', suffix[0][1]]] + suffix[1:]
+
+            prompt = chat.generate_chat_prompt(user_input, state, history={'internal': suffix})
+            if encoded_length(prompt) <= chat.get_max_prompt_length(state):
+                return prompt
+    finally:
+        shared.tokenizer = tokenizer
+
+
+@pytest.mark.parametrize('mode,template', [
+    ('instruct', None),
+    ('chat', None),
+    ('chat-instruct', None),
+    ('instruct', QWEN_TEMPLATE),
+])
+def test_truncation_matches_dropping_one_message_at_a_time(mode, template):
+    rng = random.Random(0)
+    history = [[text(rng, rng.randint(5, 60)), text(rng, rng.randint(5, 80))] for _ in range(40)]
+    for _ in range(3):
+        user_input = text(rng, 20)
+        state = make_state(history, mode, 1200, template)
+        assert chat.generate_chat_prompt(user_input, state) == untruncated_prompt(history, user_input, state)
+        history = history + [[user_input, text(rng, 40)]]
+
+
+def test_template_that_indexes_the_first_message():
+    rng = random.Random(1)
+    history = [[text(rng, 30), text(rng, 30)] for _ in range(40)]
+    state = make_state(history, 'instruct', 600, QWEN_TEMPLATE)
+
+    prompt = chat.generate_chat_prompt('hello', state)
+    assert encoded_length(prompt) <= chat.get_max_prompt_length(state)
+    assert prompt.startswith('<|im_start|>system\nYou are a helpful assistant.')
+
+
+def test_render_errors_fall_back_to_dropping_one_message_at_a_time(monkeypatch):
+    rng = random.Random(2)
+    history = [[text(rng, 30), text(rng, 30)] for _ in range(20)]
+    state = make_state(history, 'instruct', 600)
+
+    def broken(*args, **kwargs):
+        raise RuntimeError
+
+    monkeypatch.setattr(chat, 'get_message_length', broken)
+    assert chat.generate_chat_prompt('hello', state) == untruncated_prompt(history, 'hello', state)
+
+
+def bisected_prompt(user_input, state):
+    '''
+    The prompt with the user input cut by bisecting on the whole prompt, as
+    the truncation did before the planner.
+    '''
+    tokenizer = shared.tokenizer
+    shared.tokenizer = None
+    try:
+        left, right = 0, len(user_input) - 1
+        while right - left > 1:
+            mid = (left + right) // 2
+            if encoded_length(chat.generate_chat_prompt(user_input[:mid], state)) <= chat.get_max_prompt_length(state):
+                left = mid
+            else:
+                right = mid
+
+        return chat.generate_chat_prompt(user_input[:left], state)
+    finally:
+        shared.tokenizer = tokenizer
+
+
+@pytest.mark.parametrize('mode,template', [
+    ('instruct', None),
+    ('chat', None),
+    ('instruct', QWEN_TEMPLATE),
+])
+def test_oversized_input_keeps_as_much_as_bisection(mode, template):
+    rng = random.Random(3)
+    for length in (300, 2000, 5000):
+        state = make_state([], mode, 600, template)
+        user_input = text(rng, length)
+        prompt = chat.generate_chat_prompt(user_input, state)
+        bisected = bisected_prompt(user_input, state)
+        assert encoded_length(bisected) <= encoded_length(prompt) <= chat.get_max_prompt_length(state)
+        assert len(prompt) >= len(bisected)
+
+
+def test_lengths_are_not_shared_between_tokenizers(monkeypatch):
+    renderer = chat.jinja_env.from_string(QWEN_TEMPLATE).render
+    message = {'role': 'user', 'content': 'one two three'}
+    words = chat.get_message_length(renderer, 'key', message)
+
+    # the same model name reloaded with a tokenizer that counts characters
+    monkeypatch.setattr(shared, 'tokenizer', object())
+    monkeypatch.setattr(chat, 'get_encoded_length', len)
+    characters = chat.get_message_length(renderer, 'key', message)
+    assert characters != words
+    empty = {'role': 'user', 'content': ''}
+    reference = 2 * len(renderer(messages=[empty])) - len(renderer(messages=[empty, empty]))
+    assert characters == len(renderer(messages=[message])) - reference
@@ -0,0 +1,95 @@
+import random
+
+import pytest
+
+from modules.detokenizer import IncrementalDetokenizer
+
+EOS = 0
+WORDS = [' the', ' table', ' revenue', 'ing', ' 12', '.5', '\n', ' €', ' 東京', ' 😀', 'é']
+
+
+class ByteTokenizer:
+    '''
+    Byte-level tokenizer: ids 1-256 are single bytes, the rest whole words,
+    so multi-byte characters are often split across several ids. With
+    strip_leading_space it drops the leading space of the decoded text like
+    SentencePiece does.
+    '''
+
+    def __init__(self, strip_leading_space=False):
+        self.strip_leading_space = strip_leading_space
+        self.vocab = {i + 1: bytes([i]) for i in range(256)}
+        for word in WORDS:
+            self.vocab[len(self.vocab) + 1] = word.encode('utf-8')
+
+    def encode(self, text, rng):
+        '''Random segmentation of text into word and byte ids.'''
+        words = {piece: id for id, piece in self.vocab.items() if id > 256}
+        ids, data = [], text.encode('utf-8')
+        while data:
+            piece = next((w for w in words if data.startswith(w)), None)
+            if piece is not None and rng.random() < 0.7:
+                ids.append(words[piece])
+                data = data[len(piece):]
+            else:
+                ids.append(data[0] + 1)
+                data = data[1:]
+            if rng.random() < 0.05:
+                ids.append(EOS)
+        return ids
+
+    def decode(self, ids, skip_special_tokens=True):
+        pieces = []
+        for id in ids:
+            if id == EOS:
+                if not skip_special_tokens:
+                    pieces.append(b'</s>')
+                continue
+            pieces.append(self.vocab[id])
+        text = b''.join(pieces).decode('utf-8', errors='replace')
+        if self.strip_leading_space and text.startswith(' '):
+            text = text[1:]
+        return text
+
+
+def random_text(rng, n):
+    return ''.join(rng.choice(WORDS + ['a', 'b', ' ', '9']) for _ in range(n))
+
+
+@pytest.mark.parametrize('strip_leading_space', [False, True])
+def test_streamed_deltas_join_to_full_decode(strip_leading_space):
+    rng = random.Random(0)
+    tokenizer = ByteTokenizer(strip_leading_space)
+    for _ in range(300):
+        prompt_ids = tokenizer.encode(random_text(rng, rng.randint(1, 8)), rng)
+        reply_ids = tokenizer.encode(random_text(rng, rng.randint(0, 20)), rng)
+
+        detokenizer = IncrementalDetokenizer(tokenizer, prompt_ids)
+        output, deltas = list(prompt_ids), []
+        i = 0
+        while i < len(reply_ids):
+            step = rng.randint(1, 3)
+            output.extend(reply_ids[i:i + step])
+            i += step
+            delta = detokenizer.step(output)
+            assert chr(0xfffd) not in delta
+            deltas.append(delta)
+
+        expected = tokenizer.decode(prompt_ids + reply_ids)[len(tokenizer.decode(prompt_ids)):]
+        assert ''.join(deltas) == expected
+
+
+def test_split_character_is_held_back():
+    tokenizer = ByteTokenizer()
+    detokenizer = IncrementalDetokenizer(tokenizer)
+    euro = [b + 1 for b in '€'.encode('utf-8')]
+    assert detokenizer.add(euro[:1]) == ''
+    assert detokenizer.add(euro[1:2]) == ''
+    assert detokenizer.add(euro[2:]) == '€'
+
+
+def test_special_tokens():
+    tokenizer = ByteTokenizer()
+    ids = [ord('a') + 1, EOS, ord('b') + 1]
+    assert IncrementalDetokenizer(tokenizer).add(ids) == 'ab'
+    assert IncrementalDetokenizer(tokenizer, skip_special_tokens=False).add(ids) == 'a</s>b'
@@ -0,0 +1,94 @@
+import itertools
+import random
+
+import pytest
+
+import modules.chat  # noqa: F401  breaks the text_generation -> models -> chat import cycle
+from modules.text_generation import StopStringMatcher, apply_stopping_strings
+
+
+def legacy_apply_stopping_strings(reply, all_stop_strings):
+    '''The per-chunk scan StopStringMatcher replaced.'''
+    stop_found = False
+    for string in all_stop_strings:
+        idx = reply.find(string)
+        if idx != -1:
+            reply = reply[:idx]
+            stop_found = True
+            break
+
+    if not stop_found:
+        for string in all_stop_strings:
+            for j in range(len(string) - 1, 0, -1):
+                if reply[-j:] == string[:j]:
+                    reply = reply[:-j]
+                    break
+            else:
+                continue
+
+            break
+
+    return reply, stop_found
+
+
+def random_text(rng, alphabet, low, high):
+    return ''.join(rng.choice(alphabet) for _ in range(rng.randint(low, high)))
+
+
+@pytest.mark.parametrize('reply, stop_strings, expected', [
+    ('Hello\nYou: hi', ['\nYou:'], ('Hello', True)),
+    ('Hello\nYo', ['\nYou:'], ('Hello', False)),
+    ('Hello', ['\nYou:'], ('Hello', False)),
+    ('Hello', [], ('Hello', False)),
+    ('Hello', [''], ('Hello', False)),
+    ('a\nYou: b', ['You:', '\nYou:'], ('a', True)),
+    ('ab</s>cd</s>', ['</s>'], ('ab', True)),
+])
+def test_examples(reply, stop_strings, expected):
+    assert apply_stopping_strings(reply, stop_strings) == expected
+
+
+def test_single_string_matches_legacy():
+    rng = random.Random(0)
+    for _ in range(5000):
+        string = random_text(rng, 'ab\n', 1, 4)
+        reply = random_text(rng, 'ab\n', 0, 12)
+        assert apply_stopping_strings(reply, [string]) == legacy_apply_stopping_strings(reply, [string]), (reply, string)
+
+
+def test_several_strings_match_legacy():
+    # The old scan let list order pick among overlapping matches; wherever
+    # its answer does not depend on the order, the matcher has to agree
+    rng = random.Random(1)
+    compared = 0
+    for _ in range(5000):
+        strings = [random_text(rng, 'abc', 1, 4) for _ in range(3)]
+        reply = random_text(rng, 'abc', 0, 12)
+        answers = {legacy_apply_stopping_strings(reply, order) for order in itertools.permutations(strings)}
+        if len(answers) == 1:
+            compared += 1
+            assert apply_stopping_strings(reply, strings) == answers.pop(), (reply, strings)
+
+    assert compared > 1000
+
+
+def test_streaming_matches_one_shot():
+    rng = random.Random(2)
+    for _ in range(1000):
+        strings = [random_text(rng, 'ab\n', 1, 4) for _ in range(rng.randint(1, 3))]
+        reply = random_text(rng, 'ab\n', 0, 30)
+        matcher = StopStringMatcher(strings)
+        end = 0
+        while True:
+            end = min(len(reply), end + rng.randint(0, 4))
+            result = matcher.feed(reply[:end])
+            assert result == apply_stopping_strings(reply[:end], strings)
+            if result[1] or end == len(reply):
+                break
+
+
+def test_feed_rescans_a_rewritten_reply():
+    matcher = StopStringMatcher(['\nYou:'])
+    assert matcher.feed('abc\nYo') == ('abc', False)
+    assert matcher.feed('xyz') == ('xyz', False)
+    assert matcher.feed('xyz\nYou: ok') == ('xyz', True)